@@ -1,18 +1,37 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-with open('input.txt', encoding='utf-8') as fh:
-    data = [int(mass) for mass in fh.readlines() if mass]
+from typing import List, Tuple
+from itertools import islice
 
-fuel = 0
 
-modules = len(data)
-for i, mass in enumerate(data):
-    if i == modules:
-        print(fuel)  # first answer
-    fuel_for_module = mass // 3 - 2
-    if fuel_for_module >= 9:
-        data.append(fuel_for_module)
-    fuel += fuel_for_module
+def fuel_for(masses: List[int]) -> Tuple[int, int]:
+    '''
+    Return the fuel for masses, and the fuel for masses
+    and for the fuel itself: mass // 3 - 2 is applied to
+    the whole list at once, again and again, keeping only
+    the masses which still need some fuel.
+    '''
+    fuel = [mass // 3 - 2 for mass in masses]
+    modules_fuel = total_fuel = sum(fuel)
+    fuel = [mass // 3 - 2 for mass in fuel if mass >= 9]
+    while fuel:
+        total_fuel += sum(fuel)
+        fuel = [mass // 3 - 2 for mass in fuel if mass >= 9]
+    return modules_fuel, total_fuel
 
-print(fuel)  # second answer
+
+def run(chunk_size: int = 1 << 16):
+    modules_fuel = total_fuel = 0
+    with open('input.txt', encoding='utf-8') as fh:
+        masses = (int(mass) for mass in fh if mass.strip())
+        for chunk in iter(lambda: list(islice(masses, chunk_size)), []):
+            fuel = fuel_for(chunk)
+            modules_fuel += fuel[0]
+            total_fuel += fuel[1]
+
+    print(modules_fuel)  # first answer
+    print(total_fuel)  # second answer
+
+if __name__ == '__main__':
+    run()
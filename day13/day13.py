@@ -1,8 +1,12 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from typing import Sequence, Optional, Callable, List, Union, Any, MutableMapping
-from collections import defaultdict
+from typing import (
+    Sequence, Optional, Callable, List, Union, Any, MutableMapping,
+    Set, Tuple, TextIO, MutableSequence
+)
+from collections import defaultdict, deque
+import sys, time
 
 class InvalidInstruction(Exception):
     pass
@@ -28,7 +32,7 @@ class Program:
             self,
             memory: Sequence[int],
             instr_ptr: int = 0,
-            inputs: Optional[Sequence[int]] = None,
+            inputs: Optional[MutableSequence[int]] = None,
             rel_base: int = 0,
             output_recipient: Optional[Any] = None,
             input_source: Optional[Any] = None
@@ -48,7 +52,7 @@ class Program:
         for i, code in enumerate(memory):
             self.memory[i] = code
         self.instruction_pointer = instr_ptr
-        self.inputs = inputs or []
+        self.inputs = deque(inputs or [])
         self.relative_base = rel_base
         self.output_recipient = output_recipient
         self.input_source = input_source
@@ -65,6 +69,69 @@ class Program:
         )
 
 
+class FrameBuffer:
+
+    def __init__(self, stream: TextIO = sys.stdout, max_fps: Optional[float] = 30) -> None:
+        '''
+        Dense screen of one byte per cell, which grows in every
+        direction as cells are drawn outside of it. flush() writes
+        to stream only the cells changed since the previous flush,
+        moving the cursor to them with ANSI escape sequences, and
+        does nothing if called more than max_fps times per second
+        (changes are kept until the next actual flush).
+        '''
+        self.stream = stream
+        self.max_fps = max_fps
+        self.left = 0
+        self.top = 0
+        self.width = 0
+        self.height = 0
+        self.cells = bytearray()
+        self.dirty: Set[int] = set()
+        self.cleared = False
+        self.last_flush = 0.0
+
+    def resize(self, left: int, top: int, width: int, height: int) -> None:
+        cells = bytearray(b' ' * (width * height))
+        for y in range(self.height):
+            start = (y + self.top - top) * width + self.left - left
+            cells[start:start + self.width] = self.cells[y*self.width:(y+1)*self.width]
+        self.left, self.top, self.width, self.height = left, top, width, height
+        self.cells = cells
+        self.dirty = set(range(len(cells)))
+
+    def draw(self, x: int, y: int, char: str) -> None:
+        col, row = x - self.left, y - self.top
+        if not (0 <= col < self.width and 0 <= row < self.height):
+            if not self.width:
+                self.left, self.top = x, y
+            left, top = min(x, self.left), min(y, self.top)
+            right = max(x + 1, self.left + self.width)
+            bottom = max(y + 1, self.top + self.height)
+            self.resize(left, top, right - left, bottom - top)
+            col, row = x - self.left, y - self.top
+        index = row * self.width + col
+        code = ord(char)
+        if self.cells[index] != code:
+            self.cells[index] = code
+            self.dirty.add(index)
+
+    def flush(self, status: str = '', force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and self.max_fps and now - self.last_flush < 1 / self.max_fps:
+            return
+        self.last_flush = now
+        out = [] if self.cleared else ['\x1b[2J']
+        self.cleared = True
+        for index in sorted(self.dirty):
+            y, x = divmod(index, self.width)
+            out.append(f'\x1b[{y+1};{x+1}H{chr(self.cells[index])}')
+        out.append(f'\x1b[{self.height+1};1H{status}\x1b[K\n')
+        self.stream.write(''.join(out))
+        self.stream.flush()
+        self.dirty.clear()
+
+
 class ArcadeRenderer:
 
     items = {
@@ -75,9 +142,21 @@ class ArcadeRenderer:
         4: 'o'  # 'ball'
     }
 
-    def __init__(self, interactive: bool = False):
+    def __init__(
+            self,
+            interactive: bool = False,
+            headless: bool = False,
+            screen: Optional[FrameBuffer] = None
+    ) -> None:
+        '''
+        In headless mode no map is kept: only the score, the block
+        tiles drawn and the positions of the ball and the paddle
+        are tracked. If a screen is given, every tile is also drawn
+        on it, and the screen is flushed before each input.
+        '''
         self.map: MutableMapping[Tuple[int, int], int] = defaultdict(int)
-        self.buffer = []
+        self.buffer = [0, 0]
+        self.buffered = 0
         self.block_tiles = 0
         self.width = 0
         self.height = 0
@@ -85,29 +164,38 @@ class ArcadeRenderer:
         self.paddle = -1
         self.ball = -1
         self.interactive = interactive
+        self.headless = headless
+        self.screen = screen
 
     def process(self, program_output: int) -> None:
-        self.buffer.append(program_output)
-        if len(self.buffer) == 3:
-            if self.buffer[0] == -1 and self.buffer[1] == 0:
-                self.score = self.buffer[2]
-            else:
-                self.map[(self.buffer[0], self.buffer[1])] = self.buffer[2]
-                if self.buffer[2] == 2:
-                    self.block_tiles += 1
-                elif self.buffer[2] == 3:
-                    self.paddle = self.buffer[0]
-                elif self.buffer[2] == 4:
-                    self.ball = self.buffer[0]
-                if self.buffer[0] > self.width:
-                    self.width = self.buffer[0]
-                if self.buffer[1] > self.height:
-                    self.height = self.buffer[1]
-            self.buffer.clear()
+        if self.buffered < 2:
+            self.buffer[self.buffered] = program_output
+            self.buffered += 1
+            return
+        self.buffered = 0
+        x, y = self.buffer
+        if x == -1 and y == 0:
+            self.score = program_output
+            return
+        if program_output == 2:
+            self.block_tiles += 1
+        elif program_output == 3:
+            self.paddle = x
+        elif program_output == 4:
+            self.ball = x
+        if self.screen:
+            self.screen.draw(x, y, ArcadeRenderer.items[program_output])
+        if self.headless:
+            return
+        self.map[(x, y)] = program_output
+        if x > self.width:
+            self.width = x
+        if y > self.height:
+            self.height = y
 
     def clear(self):
         self.map.clear()
-        self.buffer.clear()
+        self.buffered = 0
         self.block_tiles = 0
         self.width = 0
         self.height = 0
@@ -121,8 +209,11 @@ class ArcadeRenderer:
         print(f'Score: {self.score:0>5}\n')
 
     def joystick(self):
+        if self.screen:
+            self.screen.flush(f'Score: {self.score:0>5}', force=self.interactive)
         if self.interactive:
-            self.render()
+            if not self.screen:
+                self.render()
             return(int(input('input (-1: left, 0: stand, 1: right)> ') or 0))
         else:
             if self.paddle < self.ball:
@@ -136,6 +227,111 @@ class ArcadeRenderer:
         return [self.joystick()]
 
 
+class PredictiveArcade(ArcadeRenderer):
+
+    def __init__(self, *args, walled_off: bool = False, **kwargs) -> None:
+        '''
+        Autoplay controller which, instead of chasing the ball one
+        input at a time, sends whole runs of joystick inputs:
+        below the lowest row with blocks left the ball can only bounce
+        on the side walls. While it climbs back from the paddle, the
+        column where it will reach the row below the blocks is
+        predicted and the paddle is moved under it in a single run;
+        once it falls below the blocks its landing column is
+        predicted the same way.
+        If the game was patched with wall_off(), the ball can't be
+        missed anymore and the joystick is just held still.
+        '''
+        super().__init__(*args, **kwargs)
+        self.walled_off = walled_off
+        self.ball_y = -1
+        self.ball_dx = 0
+        self.ball_dy = 0
+        self.paddle_y = -1
+        self.right_wall = 0
+        self.blocks: Set[Tuple[int, int]] = set()
+        self.lowest_block = -1  # lowest row with blocks left
+        self.requests = 0  # number of times the joystick was polled
+
+    def process(self, program_output: int) -> None:
+        if self.buffered == 2 and self.buffer != [-1, 0]:
+            x, y = self.buffer
+            if program_output == 4:
+                if self.ball != -1:
+                    self.ball_dx, self.ball_dy = x - self.ball, y - self.ball_y
+                self.ball_y = y
+            elif program_output == 3:
+                self.paddle_y = y
+            elif program_output == 2:
+                self.blocks.add((x, y))
+                self.lowest_block = max(self.lowest_block, y)
+            elif program_output == 0 and (x, y) in self.blocks:
+                self.blocks.discard((x, y))
+                if y == self.lowest_block:
+                    self.lowest_block = max((row for _, row in self.blocks), default=-1)
+            elif program_output == 1:
+                self.right_wall = max(self.right_wall, x)
+        super().process(program_output)
+
+    def landing(self, row: int) -> Tuple[int, int]:
+        '''
+        Return the column where the ball, bouncing only on the side
+        walls, will reach row, and the number of frames it will take.
+        '''
+        frames = abs(row - self.ball_y)
+        low, high = 1, self.right_wall - 1
+        x = (self.ball - low + self.ball_dx * frames) % (2 * (high - low))
+        if x > high - low:
+            x = 2 * (high - low) - x
+        return x + low, frames
+
+    def send(self) -> List[int]:
+        self.requests += 1
+        if self.walled_off:
+            return [0] * 1000
+        if self.interactive or not self.ball_dy or self.ball_y <= self.lowest_block + (self.ball_dy < 0):
+            return [self.joystick()]
+        if self.ball_dy < 0:
+            # climbing: nothing to hit before the row below the blocks,
+            # where the ball may bounce back
+            target, frames = self.landing(self.lowest_block + 1)
+            moves = target - self.paddle
+            direction = 1 if moves > 0 else -1
+            return [direction] * min(abs(moves), frames) + [0] * max(frames - abs(moves), 0)
+        target, frames = self.landing(self.paddle_y - 1)
+        moves = target - self.paddle
+        direction = 1 if moves > 0 else -1
+        # the paddle must be in place when the frame after
+        # the one that brings the ball above it is computed
+        return [direction] * abs(moves) + [0] * max(frames + 1 - abs(moves), 0) or [0]
+
+
+def wall_off(game: Program) -> bool:
+    '''
+    Patch the screen stored in the memory of the game, turning the
+    whole paddle row into paddle tiles, so that the ball can't fall.
+    The row is recognized as a single paddle tile (3) with only empty
+    tiles (0) between it and the walls (1) on both sides.
+    Return False if the paddle row is not found.
+    '''
+    memory = game.memory
+    size = len(memory)
+    for i in range(size):
+        if memory[i] != 3:
+            continue
+        left = i - 1
+        while left > 0 and memory[left] == 0:
+            left -= 1
+        right = i + 1
+        while right < size and memory[right] == 0:
+            right += 1
+        if left < i - 1 and right > i + 1 and memory[left] == 1 and memory[right] == 1:
+            for j in range(left + 1, right):
+                memory[j] = 3
+            return True
+    return False
+
+
 class IntcodeComputer:
 
     def __init__(self) -> None:
@@ -268,8 +464,7 @@ class IntcodeComputer:
         if not program.inputs and self.input_source:
             program.inputs.extend(self.input_source.send())
         try:
-            operand = self.programs[self.running_program].inputs[0]
-            del self.programs[self.running_program].inputs[0]
+            operand = self.programs[self.running_program].inputs.popleft()
         except IndexError:
             self.program_to_freeze.append(self.running_program)
             return
@@ -339,15 +534,17 @@ def run():
         program = [int(code) for code in fh.read().split(',') if code]
     computer = IntcodeComputer()
 
-    arcade = ArcadeRenderer()
+    arcade = ArcadeRenderer(headless=True)
     game = Program(program, 0, [], 0, arcade)
     computer.run_program(game)
     print(arcade.block_tiles)
 
-    arcade.clear()
+    arcade = PredictiveArcade(headless=True)
     #arcade.interactive = True
+    #arcade.screen = FrameBuffer()
     game = Program(program, 0, [], 0, arcade, arcade)
     game.memory[0] = 2
+    #arcade.walled_off = wall_off(game)
     computer.run_program(game)
     print(arcade.score)
 
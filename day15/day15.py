@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from typing import Sequence, Optional, Callable, List, Union, Any, MutableMapping, Set
-from collections import defaultdict
-from copy import deepcopy
+from typing import Sequence, Optional, Callable, List, Union, Any, MutableMapping, Set, TextIO, Dict, Tuple, Iterator
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+import sys, time
 
 
 class InvalidInstruction(Exception):
@@ -12,6 +13,9 @@ class InvalidInstruction(Exception):
 class EndProgram(Exception):
     pass
 
+class InputRequest(Exception):
+    pass
+
 
 class Instruction:
 
@@ -89,12 +93,13 @@ class RepairDroid:
     }
 
     def __init__(self):
-        self.map: MutableMapping[complex, str] = defaultdict(lambda: ' ')  # ' ': unexplored space
+        self.map = Grid(' ')  # ' ': unexplored space
         self.pos = 0j
         self.map[self.pos] = '.'
         self.last_instruction = None
         self.oxygen_system = 0j
         self.path_to_unexplored = []
+        self.screen: Optional[FrameBuffer] = None
         
     def process(self, program_output: int) -> None:
         movement = RepairDroid.movements[self.last_instruction]
@@ -108,8 +113,14 @@ class RepairDroid:
             self.pos += movement
             self.map[self.pos] = '.'
             self.oxygen_system = self.pos
+        if self.screen:
+            self.draw(self.pos - movement)
+            self.draw(self.pos + movement)
+            self.draw(self.pos)
 
     def send(self) -> Sequence[int]:
+        if self.screen:
+            self.screen.flush()
         if not self.path_to_unexplored:
             self.path_to_unexplored = self.next_path()
         if not self.path_to_unexplored:
@@ -119,51 +130,55 @@ class RepairDroid:
         #print(f'moving {RepairDroid.directions[self.last_instruction]} from {self.pos} to {self.pos + self.movements[self.last_instruction]}')
         return [self.last_instruction]
 
-    def next_path(self):
+    def next_path(self) -> List[complex]:
         '''
         Find the closest unexplored region and return
         the path toward that space.
+        Breadth first search which only remembers the parent of every
+        visited position: the path is rebuilt once, when the
+        unexplored space is found.
         '''
-        paths = [[self.pos]]
-        new_paths = []
-        dead_paths = []
-        while paths:
-            for i, path in enumerate(paths):
-                pos = path[-1]
-                walkable_paths = self.walkable_neighbours(pos) - set(path)
-                if not walkable_paths:
-                    dead_paths.append(i)
-                new_path = path.copy()
-                for index, walkable in enumerate(walkable_paths):
-                    if index:
-                        new_paths.append(new_path.copy())
-                        p = new_paths[-1]
-                    else:
-                        p = path
-                    p.append(walkable)
-                    if self.map[walkable] == ' ':
-                        return p[1:]
-            for index in reversed(dead_paths):
-                del paths[index]
-            paths.extend(new_paths)
-            dead_paths.clear()
-            new_paths.clear()
-
-    def walkable_neighbours(self, pos: complex) -> Set[complex]:
-        return set(pos + move for move in RepairDroid.movements.values() if self.map[pos + move] != '#')
+        parents: Dict[complex, complex] = {self.pos: self.pos}
+        queue = deque([self.pos])
+        while queue:
+            pos = queue.popleft()
+            for walkable in self.walkable_neighbours(pos):
+                if walkable in parents:
+                    continue
+                parents[walkable] = pos
+                if self.map[walkable] == ' ':
+                    path = [walkable]
+                    while parents[path[-1]] != self.pos:
+                        path.append(parents[path[-1]])
+                    return path[::-1]
+                queue.append(walkable)
+        return []
+
+    def walkable_neighbours(self, pos: complex) -> List[complex]:
+        return [pos + move for move in RepairDroid.movements.values() if self.map[pos + move] != '#']
+
+    def draw(self, pos: complex) -> None:
+        if pos == self.pos:
+            char = 'D'
+        elif pos == 0j:
+            char = 'O'
+        elif self.oxygen_system and pos == self.oxygen_system:
+            char = 'X'
+        else:
+            char = self.map.get(pos, ' ')
+        self.screen.draw(int(pos.real), int(pos.imag), char)
 
     def render_map(self):
-        offset_x = min(int(x.real) for x in self.map)
-        offset_y = min(int(y.imag) for y in self.map)
-        width = max(int(x.real) for x in self.map) - offset_x
-        height = max(int(y.imag) for y in self.map) - offset_y
+        if self.screen:
+            self.screen.flush(force=True)
+            return
         if self.oxygen_system:
             self.map[self.oxygen_system] = 'X'
         if self.oxygen_system != self.pos:
             self.map[self.pos] = 'D'
         self.map[0j] = 'O'
-        for y in range(height+1):
-            print(''.join(pos for x in range(width+1) for pos in self.map[complex(x + offset_x, y + offset_y)]))
+        for row in self.map.rows():
+            print(row)
         self.map[0j] = '.'
         if self.oxygen_system != self.pos:
             self.map[self.pos] = '.'
@@ -171,6 +186,292 @@ class RepairDroid:
             self.map[self.oxygen_system] = '.'
 
 
+class BacktrackingDroid(RepairDroid):
+
+    def __init__(self):
+        '''
+        Explore the maze depth first: step into an unexplored
+        neighbour if there is one, otherwise go back one step along
+        the way the droid came from. Every corridor is walked at most
+        twice and no search over the map is ever needed.
+        '''
+        super().__init__()
+        self.trail: List[complex] = []  # positions to go back to
+        self.backtracking = False
+
+    def process(self, program_output: int) -> None:
+        previous = self.pos
+        super().process(program_output)
+        if self.pos != previous and not self.backtracking:
+            self.trail.append(previous)
+
+    def send(self) -> Sequence[int]:
+        if self.screen:
+            self.screen.flush()
+        for move in RepairDroid.movements.values():
+            if self.map[self.pos + move] == ' ':
+                self.backtracking = False
+                self.last_instruction = RepairDroid.instructions[move]
+                return [self.last_instruction]
+        if not self.trail:
+            raise EndProgram
+        self.backtracking = True
+        self.last_instruction = RepairDroid.instructions[self.trail.pop() - self.pos]
+        return [self.last_instruction]
+
+
+class ForkingExplorer:
+
+    def __init__(self, program: Sequence[int], workers: int = 0):
+        '''
+        Explore the maze without ever moving back: at every step the
+        program of each droid on the frontier is cloned once for every
+        unexplored neighbour, and every clone tries a single move.
+        Clones which moved become the next frontier, so the maze is
+        mapped breadth first, and the distance from the origin
+        of every position is known as soon as it is reached.
+        With workers > 0 the moves of a frontier are tried
+        in that many processes and their results merged.
+        No droid is ever driven by the program: the map is filled in
+        self.droid, which stays at the origin.
+        '''
+        self.droid = RepairDroid()
+        self.program = Program(program)
+        self.workers = workers
+        self.distances: Dict[complex, int] = {self.droid.pos: 0}
+        self.executed = 0  # instructions executed by all the clones
+
+    def explore(self) -> RepairDroid:
+        '''
+        Map the whole maze and return the droid holding the map.
+        '''
+        frontier = [(self.droid.pos, self.program)]
+        pool = ProcessPoolExecutor(self.workers) if self.workers else None
+        try:
+            while frontier:
+                moves = {}  # unexplored position: (droid position, snapshot)
+                for pos, snapshot in frontier:
+                    for move in RepairDroid.movements.values():
+                        if self.droid.map[pos + move] == ' ' and pos + move not in moves:
+                            moves[pos + move] = (pos, snapshot)
+                snapshots = [snapshot for pos, snapshot in moves.values()]
+                instructions = [RepairDroid.instructions[dest - pos] for dest, (pos, _) in moves.items()]
+                if pool:
+                    results = pool.map(try_move, snapshots, instructions, chunksize=16)
+                else:
+                    results = map(try_move, snapshots, instructions)
+                frontier = []
+                for (dest, (pos, _)), (status, snapshot, executed) in zip(moves.items(), results):
+                    self.executed += executed
+                    if status == 0:
+                        self.droid.map[dest] = '#'
+                        continue
+                    self.droid.map[dest] = '.'
+                    self.distances[dest] = self.distances[pos] + 1
+                    if status == 2:
+                        self.droid.oxygen_system = dest
+                    frontier.append((dest, snapshot))
+        finally:
+            if pool:
+                pool.shutdown()
+        return self.droid
+
+
+class FrameBuffer:
+
+    def __init__(self, stream: TextIO = sys.stdout, max_fps: Optional[float] = 30) -> None:
+        '''
+        Dense screen of one byte per cell, which grows in every
+        direction as cells are drawn outside of it. flush() writes
+        to stream only the cells changed since the previous flush,
+        moving the cursor to them with ANSI escape sequences, and
+        does nothing if called more than max_fps times per second
+        (changes are kept until the next actual flush).
+        '''
+        self.stream = stream
+        self.max_fps = max_fps
+        self.left = 0
+        self.top = 0
+        self.width = 0
+        self.height = 0
+        self.cells = bytearray()
+        self.dirty: Set[int] = set()
+        self.cleared = False
+        self.last_flush = 0.0
+
+    def resize(self, left: int, top: int, width: int, height: int) -> None:
+        cells = bytearray(b' ' * (width * height))
+        for y in range(self.height):
+            start = (y + self.top - top) * width + self.left - left
+            cells[start:start + self.width] = self.cells[y*self.width:(y+1)*self.width]
+        self.left, self.top, self.width, self.height = left, top, width, height
+        self.cells = cells
+        self.dirty = set(range(len(cells)))
+
+    def draw(self, x: int, y: int, char: str) -> None:
+        col, row = x - self.left, y - self.top
+        if not (0 <= col < self.width and 0 <= row < self.height):
+            if not self.width:
+                self.left, self.top = x, y
+            left, top = min(x, self.left), min(y, self.top)
+            right = max(x + 1, self.left + self.width)
+            bottom = max(y + 1, self.top + self.height)
+            self.resize(left, top, right - left, bottom - top)
+            col, row = x - self.left, y - self.top
+        index = row * self.width + col
+        code = ord(char)
+        if self.cells[index] != code:
+            self.cells[index] = code
+            self.dirty.add(index)
+
+    def flush(self, status: str = '', force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and self.max_fps and now - self.last_flush < 1 / self.max_fps:
+            return
+        self.last_flush = now
+        out = [] if self.cleared else ['\x1b[2J']
+        self.cleared = True
+        for index in sorted(self.dirty):
+            y, x = divmod(index, self.width)
+            out.append(f'\x1b[{y+1};{x+1}H{chr(self.cells[index])}')
+        out.append(f'\x1b[{self.height+1};1H{status}\x1b[K\n')
+        self.stream.write(''.join(out))
+        self.stream.flush()
+        self.dirty.clear()
+
+
+class Grid:
+
+    movements = (0 - 1j, 0 + 1j, -1 + 0j, 1 + 0j)
+
+    def __init__(self, default: Union[str, int] = ' ') -> None:
+        '''
+        Dense 2-D map of one byte per cell (a character or a small
+        int, like default), indexed by complex coordinates, which
+        grows in every direction as cells are set outside of it.
+        A border of default cells is always kept around the
+        bounding box of the cells set, so the neighbours of any
+        cell inside it are plain index offsets. Cells never set
+        read as default, but (unlike a defaultdict) reading them
+        does not add them to the map.
+        '''
+        self.text = isinstance(default, str)
+        self.default = ord(default) if self.text else default
+        self.left = 0
+        self.top = 0
+        self.width = 0
+        self.height = 0
+        self.cells = bytearray()
+        self.bounds: Optional[Tuple[int, int, int, int]] = None  # min x, min y, max x, max y
+
+    def resize(self, left: int, top: int, width: int, height: int) -> None:
+        cells = bytearray([self.default]) * (width * height)
+        for y in range(self.height):
+            start = (y + self.top - top) * width + self.left - left
+            cells[start:start + self.width] = self.cells[y*self.width:(y+1)*self.width]
+        self.left, self.top, self.width, self.height = left, top, width, height
+        self.cells = cells
+
+    def index(self, pos: complex) -> int:
+        col, row = int(pos.real) - self.left, int(pos.imag) - self.top
+        if 0 <= col < self.width and 0 <= row < self.height:
+            return row * self.width + col
+        return -1
+
+    def __getitem__(self, pos: complex) -> Union[str, int]:
+        col, row = int(pos.real) - self.left, int(pos.imag) - self.top
+        if 0 <= col < self.width and 0 <= row < self.height:
+            code = self.cells[row * self.width + col]
+        else:
+            code = self.default
+        return chr(code) if self.text else code
+
+    def __setitem__(self, pos: complex, value: Union[str, int]) -> None:
+        x, y = int(pos.real), int(pos.imag)
+        code = ord(value) if self.text else value
+        if self.bounds and self.bounds[0] <= x <= self.bounds[2] and self.bounds[1] <= y <= self.bounds[3]:
+            self.cells[(y - self.top) * self.width + x - self.left] = code
+            return
+        if self.bounds is None:
+            self.bounds = (x, y, x, y)
+        else:
+            min_x, min_y, max_x, max_y = self.bounds
+            self.bounds = (min(x, min_x), min(y, min_y), max(x, max_x), max(y, max_y))
+        min_x, min_y, max_x, max_y = self.bounds
+        if (min_x <= self.left or min_y <= self.top or
+                max_x >= self.left + self.width - 1 or max_y >= self.top + self.height - 1):
+            margin_x = (max_x - min_x) // 2 + 1
+            margin_y = (max_y - min_y) // 2 + 1
+            self.resize(
+                min_x - margin_x, min_y - margin_y,
+                max_x - min_x + 1 + 2 * margin_x, max_y - min_y + 1 + 2 * margin_y
+            )
+        self.cells[(y - self.top) * self.width + x - self.left] = code
+
+    def __contains__(self, pos: complex) -> bool:
+        if self.bounds is None:
+            return False
+        min_x, min_y, max_x, max_y = self.bounds
+        return min_x <= pos.real <= max_x and min_y <= pos.imag <= max_y
+
+    def get(self, pos: complex, default: Any = None) -> Any:
+        return self[pos] if pos in self else default
+
+    def __iter__(self) -> Iterator[complex]:
+        if self.bounds is None:
+            return
+        min_x, min_y, max_x, max_y = self.bounds
+        for y in range(min_y, max_y + 1):
+            for x in range(min_x, max_x + 1):
+                yield complex(x, y)
+
+    def items(self) -> Iterator[Tuple[complex, Union[str, int]]]:
+        if self.bounds is None:
+            return
+        min_x, min_y = self.bounds[:2]
+        for y, row in enumerate(self.rows(), min_y):
+            for x, value in enumerate(row, min_x):
+                yield complex(x, y), value
+
+    def values(self) -> List[Union[str, int]]:
+        return [value for row in self.rows() for value in row]
+
+    def rows(self) -> List[Union[str, bytes]]:
+        '''
+        The cells inside the bounding box, one row at a time
+        (strings if the grid holds characters).
+        '''
+        if self.bounds is None:
+            return []
+        min_x, min_y, max_x, max_y = self.bounds
+        rows = []
+        for y in range(min_y - self.top, max_y - self.top + 1):
+            start = y * self.width + min_x - self.left
+            row = bytes(self.cells[start:start + max_x - min_x + 1])
+            rows.append(row.decode('latin-1') if self.text else row)
+        return rows
+
+    def neighbours(self, pos: complex) -> List[Union[str, int]]:
+        '''
+        Values of the cells north, south, west and east of pos.
+        '''
+        if pos not in self:
+            return [self[pos + move] for move in Grid.movements]
+        index = self.index(pos)
+        cells = self.cells
+        codes = (cells[index - self.width], cells[index + self.width], cells[index - 1], cells[index + 1])
+        return [chr(code) for code in codes] if self.text else list(codes)
+
+    def count_neighbours(self, pos: complex, value: Union[str, int]) -> int:
+        return self.neighbours(pos).count(value)
+
+    def copy(self) -> 'Grid':
+        grid = Grid.__new__(Grid)
+        grid.__dict__.update(self.__dict__)
+        grid.cells = self.cells.copy()
+        return grid
+
+
 class IntcodeComputer:
 
     def __init__(self) -> None:
@@ -195,6 +496,7 @@ class IntcodeComputer:
         self.program_to_freeze: List[int] = []
         self.output_recipient = None
         self.input_source = None
+        self.executed = 0  # instructions executed so far
 
     def add_program(self, program: Program):
         self.programs.append(program)
@@ -232,6 +534,7 @@ class IntcodeComputer:
             # print(f'BEFORE\nrunning program index {self.running_program}')
             # self.programs[self.running_program].dump_program()
             offset = self.compute()
+            self.executed += 1
             if offset and not self.program_to_freeze:
                 self.instruction_pointer += offset
             # print(f'AFTER\nrunning program index {self.running_program}')
@@ -368,52 +671,119 @@ class IntcodeComputer:
             )
         return self.instructions[instruction].size
 
-def bfs(graph: MutableMapping[complex, str], start: complex, end: complex):
-    if end is not None:
-        condition = lambda: graph[end] != 'O'
-    else:
-        condition = lambda: any(pos == '.' for pos in graph.values())
-    paths = [[start]]
-    new_paths = []
-    dead_paths = []
-    steps = 0
-    movements = [ 0 - 1j, 0 + 1j, -1 + 0j, 1 + 0j ]
-    while condition():
-        steps += 1
-        for i, path in enumerate(paths):
-            pos = path[-1]
-            neighbours = [pos + movement for movement in movements if graph[pos + movement] == '.']
-            if not neighbours:
-                dead_paths.append(i)
-            for index, neighbour in enumerate(neighbours):
-                if not index:
-                    p = path
-                else:
-                    new_paths.append(path[:-1])
-                    p = new_paths[-1]
-                p.append(neighbour)
-                graph[neighbour] = 'O'
-        for i in reversed(dead_paths):
-            del paths[i]
-        dead_paths.clear()
-        paths.extend(new_paths)
-        new_paths.clear()
-    return steps
-
-def run():
-    with open('input.txt', encoding='utf-8') as fh:
-        program = [int(code) for code in fh.read().split(',') if code]
-    computer = IntcodeComputer()
+class DistanceField:
 
-    droid = RepairDroid()
-    moves = Program(program, 0, [], 0, droid, droid)
+    def __init__(self, graph: MutableMapping[complex, str], sources: Sequence[complex]) -> None:
+        '''
+        Distances of every open position of graph from the nearest
+        of sources, found with a single breadth first flood fill.
+        The map is packed in a flat grid over its bounding box
+        (with a border of walls), so neighbours are index offsets
+        and every distance lives in one array (-1: unreachable).
+        '''
+        self.left = min(int(pos.real) for pos in graph) - 1
+        self.top = min(int(pos.imag) for pos in graph) - 1
+        self.width = max(int(pos.real) for pos in graph) - self.left + 2
+        height = max(int(pos.imag) for pos in graph) - self.top + 2
+        open_ = bytearray(self.width * height)
+        for pos, char in graph.items():
+            if char == '.':
+                open_[self.index(pos)] = 1
+        self.distances = [-1] * len(open_)
+        frontier = deque()
+        for source in sources:
+            self.distances[self.index(source)] = 0
+            frontier.append(self.index(source))
+        offsets = (-self.width, self.width, -1, 1)
+        while frontier:
+            index = frontier.popleft()
+            distance = self.distances[index] + 1
+            for offset in offsets:
+                neighbour = index + offset
+                if open_[neighbour] and self.distances[neighbour] < 0:
+                    self.distances[neighbour] = distance
+                    frontier.append(neighbour)
+
+    def index(self, pos: complex) -> int:
+        return (int(pos.imag) - self.top) * self.width + int(pos.real) - self.left
+
+    def __getitem__(self, pos: complex) -> int:
+        return self.distances[self.index(pos)]
+
+    def max(self) -> int:
+        return max(self.distances)
+
+def bfs(graph: MutableMapping[complex, str], start: complex, end: Optional[complex]) -> int:
+    '''
+    Steps from start to end or, if end is None, to the
+    farthest reachable position.
+    '''
+    field = DistanceField(graph, [start])
+    return field[end] if end is not None else field.max()
+
+def explore(program: Sequence[int], droid: RepairDroid) -> int:
+    '''
+    Let droid explore the whole maze and return
+    the number of instructions executed by the program.
+    '''
+    computer = IntcodeComputer()
     try:
-        computer.run_program(moves)
+        computer.run_program(Program(program, 0, [], 0, droid, droid))
     except EndProgram:
         pass
+    return computer.executed
+
+
+class SingleMove:
+
+    def __init__(self, instruction: int) -> None:
+        self.instruction = [instruction]
+        self.status = None
+
+    def process(self, program_output: int) -> None:
+        self.status = program_output
+
+    def send(self) -> Sequence[int]:
+        if not self.instruction:
+            raise InputRequest
+        instruction, self.instruction = self.instruction, []
+        return instruction
+
+def try_move(snapshot: Program, instruction: int) -> Tuple[int, Program, int]:
+    '''
+    Run a clone of snapshot until it asks for the input after
+    instruction. Return the status reported by the droid,
+    the snapshot of the clone and the instructions it executed.
+    '''
+    move = SingleMove(instruction)
+    program = Program([], snapshot.instruction_pointer, [], snapshot.relative_base, move, move)
+    program.memory = snapshot.memory  # copied by load_program
+    computer = IntcodeComputer()
+    try:
+        computer.run_program(program)
+    except InputRequest:
+        pass
+    clone = Program([], computer.instruction_pointer, [], computer.relative_base)
+    clone.memory = computer.memory
+    return move.status, clone, computer.executed
+
+
+def run(forking: bool = False):
+    with open('input.txt', encoding='utf-8') as fh:
+        program = [int(code) for code in fh.read().split(',') if code]
+
+    if forking:  # clone the program instead of moving back
+        droid = ForkingExplorer(program).explore()
+        #droid = ForkingExplorer(program, workers=4).explore()
+    else:
+        droid = RepairDroid()
+        #droid = BacktrackingDroid()  # depth first exploration
+        #droid.screen = FrameBuffer()
+        explore(program, droid)
     droid.render_map()
-    print(f'Steps from origin to oxygen system: {bfs(deepcopy(droid.map), 0j, droid.oxygen_system)}')
-    print(f'Minutes to fill the space with oxygen: {bfs(deepcopy(droid.map), droid.oxygen_system, None)}')
+    oxygen = DistanceField(droid.map, [droid.oxygen_system])
+    print(f'Steps from origin to oxygen system: {oxygen[0j]}')
+    print(f'Minutes to fill the space with oxygen: {oxygen.max()}')
 
 if __name__ == '__main__':
     run()
@@ -1,9 +1,11 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from typing import Sequence, Optional, Callable, List, Union, Any, MutableMapping, Set
+from typing import Sequence, Optional, Callable, List, Union, Any, Set, TextIO, Tuple, Iterator
 from collections import defaultdict
+from functools import lru_cache
 from copy import deepcopy
+import sys, time
 
 
 class InvalidInstruction(Exception):
@@ -70,55 +72,405 @@ class Program:
         )
 
 
-class Cameras:
+class AsciiChannel:
+
+    def __init__(self, separator: bytes = b'\n', stream: Optional[TextIO] = sys.stdout) -> None:
+        '''
+        Output recipient for programs which talk ASCII: the values
+        output are collected in a bytearray, and every time the data
+        collected ends with separator (a line, or a frame of a video
+        feed with b'\n\n') it is passed to receive() as a memoryview,
+        valid only during the call. Values above 127 are not text,
+        and are passed to number() instead.
+        Both write to stream, if there is one.
+        '''
+        self.separator = separator
+        self.stream = stream
+        self.buffer = bytearray()
+        self.numbers: List[int] = []
+
+    def process(self, output: int) -> None:
+        if output > 127:
+            self.number(output)
+            return
+        self.buffer.append(output)
+        if output == self.separator[-1] and self.buffer.endswith(self.separator):
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.buffer:
+            return
+        with memoryview(self.buffer) as data:
+            self.receive(data)
+        self.buffer.clear()
+
+    def receive(self, data: memoryview) -> None:
+        if self.stream:
+            self.stream.write(str(data, 'ascii'))
+
+    def number(self, value: int) -> None:
+        self.flush()
+        self.numbers.append(value)
+        if self.stream:
+            self.stream.write(f'{value}\n')
+
+
+class Cameras(AsciiChannel):
+
+    scaffold = bytes(ord('1') if chr(c) in '#^v<>' else ord('0') for c in range(256))
 
     def __init__(self):
-        self.map: MutableMapping[Tuple(int, int), str] = defaultdict(lambda: ' ')  # ' ': unexplored space
-        self.ascii_map: List[str] = []
+        super().__init__(separator=b'\n\n', stream=None)
+        self.map = Grid(' ')  # ' ': unexplored space
         self.pos = 0j
         self.width = 0
         self.height = 0
+        self.frame: List[bytes] = []
         self.intersections = []
+        self.screen: Optional[FrameBuffer] = None
         
-    def process(self, program_output: int) -> None:
-        self.ascii_map.append(chr(program_output))
+    def receive(self, data: memoryview) -> None:
+        self.frame = [row for row in bytes(data).split(b'\n') if row]
 
     def render_ascii_map(self):
-        print(''.join(c for c in self.ascii_map))
+        print(b'\n'.join(self.frame).decode('ascii'))
 
     def prepare_map(self):
-        row_length = self.ascii_map.index('\n')
-        row = 0
-        for i, c in enumerate(self.ascii_map):
-            if c == '\n':
-                row += 1
-                continue
-            self.map[(i - row * row_length - row, row)] = c
-        self.width = max((x[0] for x in self.map))
-        self.height = max((y[1] for y in self.map))
+        self.flush()
+        self.map = Grid.from_rows(self.frame)
+        _, _, self.width, self.height = self.map.bounds
 
     def render_map(self):
-        for y in range(self.height + 1):
-            print(''.join(pos for x in range(self.width + 1) for pos in self.map[(x, y)]))
+        if self.screen:
+            for pos, c in self.map.items():
+                self.screen.draw(int(pos.real), int(pos.imag), c)
+            self.screen.flush(force=True)
+            return
+        for row in self.map.rows():
+            print(row)
 
-    def find_intersections(self):
+    def find_intersections(self) -> int:
+        '''
+        Every row of the frame becomes an int with a bit set for
+        every scaffold cell (the robot included), so the cells with
+        scaffold on all sides are found for a whole row at once
+        by and-ing it with its shifted self and the rows around it.
+        '''
+        rows = [int(row.translate(Cameras.scaffold), 2) for row in self.frame]
         inter_sum = 0
-        for y in range(self.height + 1):
-            for x in range(self.width + 1):
-                if self.map[(x, y)] == '#':
-                    if self.map[(x+1, y)] + self.map[(x-1, y)] + self.map[(x, y+1)] + self.map[(x, y+1)] == '####':
-                        self.intersections.append((x, y))
-                        inter_sum += x * y
+        for y in range(1, len(rows) - 1):
+            crossings = rows[y] & (rows[y] << 1) & (rows[y] >> 1) & rows[y-1] & rows[y+1]
+            while crossings:
+                bit = crossings.bit_length() - 1
+                crossings ^= 1 << bit
+                x = self.width - bit
+                self.intersections.append((x, y))
+                inter_sum += x * y
         return inter_sum
 
+    def scaffold_path(self) -> List[str]:
+        '''
+        Walk the scaffold from the robot, going straight on as long
+        as possible and turning only at its ends, and return the
+        path as a list of turns and numbers of steps. The path starts
+        with a number of steps if the robot already faces along the
+        scaffold, or with R,R if it has to turn around.
+        '''
+        facing = {'^': 0 - 1j, 'v': 0 + 1j, '<': -1 + 0j, '>': 1 + 0j}
+        pos = next(pos for pos, c in self.map.items() if c in facing)
+        direction = facing[self.map[pos]]
+        path: List[str] = []
+        while True:
+            if self.map[pos + direction] != '#':
+                for turn, rotation in (('L', -1j), ('R', 1j)):
+                    if self.map[pos + direction * rotation] == '#':
+                        direction *= rotation
+                        path.append(turn)
+                        break
+                else:
+                    if path or self.map[pos - direction] != '#':
+                        break
+                    direction = -direction
+                    path.extend(('R', 'R'))
+            steps = 0
+            while self.map[pos + direction] == '#':
+                pos += direction
+                steps += 1
+            path.append(str(steps))
+        if not path:
+            raise ValueError('no scaffold next to the robot')
+        return path
+
+
+def compress(
+        path: Sequence[str],
+        functions: int = 3,
+        max_length: int = 20
+) -> Tuple[List[int], Tuple[Tuple[str, ...], ...]]:
+    '''
+    Split path in calls to at most functions movement functions,
+    so that the main routine and every function are at most
+    max_length characters long once joined by commas.
+    Depth first search: at every point of the path try every
+    function found so far, then every prefix short enough to be
+    a new one (longest first). Return the indexes of the
+    functions called and the functions; raise ValueError
+    if path cannot be split.
+    '''
+    path = tuple(path)
+    max_calls = (max_length + 1) // 2
+
+    @lru_cache(maxsize=None)
+    def search(start: int, found: Tuple[Tuple[str, ...], ...], calls: int):
+        if start == len(path):
+            return [], found
+        if calls == max_calls:
+            return None
+        candidates = list(found)
+        if len(found) < functions:
+            end = start
+            while end < len(path) and len(','.join(path[start:end+1])) <= max_length:
+                end += 1
+            candidates.extend(path[start:stop] for stop in range(end, start, -1) if path[start:stop] not in found)
+        for function in candidates:
+            if path[start:start+len(function)] != function:
+                continue
+            new_found = found if function in found else found + (function,)
+            result = search(start + len(function), new_found, calls + 1)
+            if result is not None:
+                return [new_found.index(function)] + result[0], result[1]
+        return None
+
+    result = search(0, (), 0)
+    if result is None:
+        raise ValueError(
+            f'path cannot be split in {functions} functions of at most {max_length} characters'
+        )
+    return result
 
-class Vacuum:
 
-    def __init__(self):
+class FrameBuffer:
+
+    def __init__(self, stream: TextIO = sys.stdout, max_fps: Optional[float] = 30) -> None:
+        '''
+        Dense screen of one byte per cell, which grows in every
+        direction as cells are drawn outside of it. flush() writes
+        to stream only the cells changed since the previous flush,
+        moving the cursor to them with ANSI escape sequences, and
+        does nothing if called more than max_fps times per second
+        (changes are kept until the next actual flush).
+        '''
+        self.stream = stream
+        self.max_fps = max_fps
+        self.left = 0
+        self.top = 0
+        self.width = 0
+        self.height = 0
+        self.cells = bytearray()
+        self.dirty: Set[int] = set()
+        self.cleared = False
+        self.last_flush = 0.0
+
+    def resize(self, left: int, top: int, width: int, height: int) -> None:
+        cells = bytearray(b' ' * (width * height))
+        for y in range(self.height):
+            start = (y + self.top - top) * width + self.left - left
+            cells[start:start + self.width] = self.cells[y*self.width:(y+1)*self.width]
+        self.left, self.top, self.width, self.height = left, top, width, height
+        self.cells = cells
+        self.dirty = set(range(len(cells)))
+
+    def draw(self, x: int, y: int, char: str) -> None:
+        col, row = x - self.left, y - self.top
+        if not (0 <= col < self.width and 0 <= row < self.height):
+            if not self.width:
+                self.left, self.top = x, y
+            left, top = min(x, self.left), min(y, self.top)
+            right = max(x + 1, self.left + self.width)
+            bottom = max(y + 1, self.top + self.height)
+            self.resize(left, top, right - left, bottom - top)
+            col, row = x - self.left, y - self.top
+        index = row * self.width + col
+        code = ord(char)
+        if self.cells[index] != code:
+            self.cells[index] = code
+            self.dirty.add(index)
+
+    def flush(self, status: str = '', force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and self.max_fps and now - self.last_flush < 1 / self.max_fps:
+            return
+        self.last_flush = now
+        out = [] if self.cleared else ['\x1b[2J']
+        self.cleared = True
+        for index in sorted(self.dirty):
+            y, x = divmod(index, self.width)
+            out.append(f'\x1b[{y+1};{x+1}H{chr(self.cells[index])}')
+        out.append(f'\x1b[{self.height+1};1H{status}\x1b[K\n')
+        self.stream.write(''.join(out))
+        self.stream.flush()
+        self.dirty.clear()
+
+
+class Vacuum(AsciiChannel):
+
+    def __init__(self, stream: Optional[TextIO] = None):
+        '''
+        With the video feed on, stream gets a frame at a time.
+        '''
+        super().__init__(separator=b'\n\n', stream=stream)
         self.cleaned_dust = 0
 
-    def process(self, program_output):
-        self.cleaned_dust = program_output
+    def number(self, value: int) -> None:
+        super().number(value)
+        self.cleaned_dust = value
+
+
+class Grid:
+
+    movements = (0 - 1j, 0 + 1j, -1 + 0j, 1 + 0j)
+
+    def __init__(self, default: Union[str, int] = ' ') -> None:
+        '''
+        Dense 2-D map of one byte per cell (a character or a small
+        int, like default), indexed by complex coordinates, which
+        grows in every direction as cells are set outside of it.
+        A border of default cells is always kept around the
+        bounding box of the cells set, so the neighbours of any
+        cell inside it are plain index offsets. Cells never set
+        read as default, but (unlike a defaultdict) reading them
+        does not add them to the map.
+        '''
+        self.text = isinstance(default, str)
+        self.default = ord(default) if self.text else default
+        self.left = 0
+        self.top = 0
+        self.width = 0
+        self.height = 0
+        self.cells = bytearray()
+        self.bounds: Optional[Tuple[int, int, int, int]] = None  # min x, min y, max x, max y
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Union[str, bytes]], default: Union[str, int] = ' ') -> 'Grid':
+        '''
+        Grid with the rows given (all of the same length),
+        the first cell at (0, 0), copied a row at a time.
+        '''
+        grid = cls(default)
+        width = len(rows[0])
+        grid.resize(-1, -1, width + 2, len(rows) + 2)
+        for y, row in enumerate(rows, 1):
+            start = y * grid.width + 1
+            grid.cells[start:start + width] = row.encode('latin-1') if isinstance(row, str) else row
+        grid.bounds = (0, 0, width - 1, len(rows) - 1)
+        return grid
+
+    def resize(self, left: int, top: int, width: int, height: int) -> None:
+        cells = bytearray([self.default]) * (width * height)
+        for y in range(self.height):
+            start = (y + self.top - top) * width + self.left - left
+            cells[start:start + self.width] = self.cells[y*self.width:(y+1)*self.width]
+        self.left, self.top, self.width, self.height = left, top, width, height
+        self.cells = cells
+
+    def index(self, pos: complex) -> int:
+        col, row = int(pos.real) - self.left, int(pos.imag) - self.top
+        if 0 <= col < self.width and 0 <= row < self.height:
+            return row * self.width + col
+        return -1
+
+    def __getitem__(self, pos: complex) -> Union[str, int]:
+        col, row = int(pos.real) - self.left, int(pos.imag) - self.top
+        if 0 <= col < self.width and 0 <= row < self.height:
+            code = self.cells[row * self.width + col]
+        else:
+            code = self.default
+        return chr(code) if self.text else code
+
+    def __setitem__(self, pos: complex, value: Union[str, int]) -> None:
+        x, y = int(pos.real), int(pos.imag)
+        code = ord(value) if self.text else value
+        if self.bounds and self.bounds[0] <= x <= self.bounds[2] and self.bounds[1] <= y <= self.bounds[3]:
+            self.cells[(y - self.top) * self.width + x - self.left] = code
+            return
+        if self.bounds is None:
+            self.bounds = (x, y, x, y)
+        else:
+            min_x, min_y, max_x, max_y = self.bounds
+            self.bounds = (min(x, min_x), min(y, min_y), max(x, max_x), max(y, max_y))
+        min_x, min_y, max_x, max_y = self.bounds
+        if (min_x <= self.left or min_y <= self.top or
+                max_x >= self.left + self.width - 1 or max_y >= self.top + self.height - 1):
+            margin_x = (max_x - min_x) // 2 + 1
+            margin_y = (max_y - min_y) // 2 + 1
+            self.resize(
+                min_x - margin_x, min_y - margin_y,
+                max_x - min_x + 1 + 2 * margin_x, max_y - min_y + 1 + 2 * margin_y
+            )
+        self.cells[(y - self.top) * self.width + x - self.left] = code
+
+    def __contains__(self, pos: complex) -> bool:
+        if self.bounds is None:
+            return False
+        min_x, min_y, max_x, max_y = self.bounds
+        return min_x <= pos.real <= max_x and min_y <= pos.imag <= max_y
+
+    def get(self, pos: complex, default: Any = None) -> Any:
+        return self[pos] if pos in self else default
+
+    def __iter__(self) -> Iterator[complex]:
+        if self.bounds is None:
+            return
+        min_x, min_y, max_x, max_y = self.bounds
+        for y in range(min_y, max_y + 1):
+            for x in range(min_x, max_x + 1):
+                yield complex(x, y)
+
+    def items(self) -> Iterator[Tuple[complex, Union[str, int]]]:
+        if self.bounds is None:
+            return
+        min_x, min_y = self.bounds[:2]
+        for y, row in enumerate(self.rows(), min_y):
+            for x, value in enumerate(row, min_x):
+                yield complex(x, y), value
+
+    def values(self) -> List[Union[str, int]]:
+        return [value for row in self.rows() for value in row]
+
+    def rows(self) -> List[Union[str, bytes]]:
+        '''
+        The cells inside the bounding box, one row at a time
+        (strings if the grid holds characters).
+        '''
+        if self.bounds is None:
+            return []
+        min_x, min_y, max_x, max_y = self.bounds
+        rows = []
+        for y in range(min_y - self.top, max_y - self.top + 1):
+            start = y * self.width + min_x - self.left
+            row = bytes(self.cells[start:start + max_x - min_x + 1])
+            rows.append(row.decode('latin-1') if self.text else row)
+        return rows
+
+    def neighbours(self, pos: complex) -> List[Union[str, int]]:
+        '''
+        Values of the cells north, south, west and east of pos.
+        '''
+        if pos not in self:
+            return [self[pos + move] for move in Grid.movements]
+        index = self.index(pos)
+        cells = self.cells
+        codes = (cells[index - self.width], cells[index + self.width], cells[index - 1], cells[index + 1])
+        return [chr(code) for code in codes] if self.text else list(codes)
+
+    def count_neighbours(self, pos: complex, value: Union[str, int]) -> int:
+        return self.neighbours(pos).count(value)
+
+    def copy(self) -> 'Grid':
+        grid = Grid.__new__(Grid)
+        grid.__dict__.update(self.__dict__)
+        grid.cells = self.cells.copy()
+        return grid
 
 
 class IntcodeComputer:
@@ -325,6 +677,7 @@ def run():
     computer = IntcodeComputer()
 
     views = Cameras()
+    #views.screen = FrameBuffer()
     ascii_program = Program(program, 0, [], 0, views, views)
     computer.run_program(ascii_program)
     views.prepare_map()
@@ -333,12 +686,11 @@ def run():
 
     program[0] = 2
     vacuum_robot = Vacuum()
+    #vacuum_robot = Vacuum(sys.stdout)  # with video_feed = 'y\n'
     vacuum_program = Program(program, 0, [], 0, vacuum_robot, vacuum_robot)
-    # Sequence found 'by hand'
-    main_movement = 'A,A,B,C,B,C,B,C,B,A\n'
-    A = 'R,6,L,12,R,6\n'
-    B = 'L,12,R,6,L,8,L,12\n'
-    C = 'R,12,L,10,L,10\n'
+    calls, functions = compress(views.scaffold_path())
+    main_movement = ','.join('ABC'[call] for call in calls) + '\n'
+    A, B, C = (','.join(function) + '\n' for function in functions + ((),) * (3 - len(functions)))
     video_feed = 'n\n'
     vacuum_program.inputs.extend(ord(c) for c in list(main_movement + A + B + C + video_feed))
     computer.run_program(vacuum_program)
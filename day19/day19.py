@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from typing import Sequence, Optional, Callable, List, Union, Any, MutableMapping, Set
-from collections import defaultdict
+from typing import Sequence, Optional, Callable, List, Union, Any, MutableMapping, Set, Tuple, TextIO
+from collections import defaultdict, OrderedDict
 from copy import deepcopy
+import sys, time
 
 
 class InvalidInstruction(Exception):
@@ -76,35 +77,17 @@ class DroidControl:
         self.map: MutableMapping[Tuple[int, int], int] = defaultdict(int)
         self.width = 50
         self.height = 50
-        self.last_coords: Tuple[int, int] = ()
         self.regions_affected = 0
         self.offset_x = 0
         self.offset_y = 0
-
-    def reset(self):
-        self.width = 0
-        self.height = 0
-        self.last_coords = ()
-        self.regions_affected = 0
-        self.offset_x = 0
-        self.offset_y = 0
-
-    def process(self, program_output: int):
-        self.map[self.last_coords] = program_output
-        if program_output == 1:
-            self.regions_affected += 1
-
-    def send(self) -> List[int]:
-        if not self.last_coords:
-            self.last_coords = (self.offset_x, self.offset_y)
-        elif self.last_coords[0] == self.offset_x + self.width - 1:
-            self.last_coords = (self.offset_x, self.last_coords[1] + 1)
-        else:
-            self.last_coords = (self.last_coords[0] + 1, self.last_coords[1])
-        #print('returning', self.last_coords)
-        return self.last_coords
+        self.screen: Optional[FrameBuffer] = None
 
     def render_map(self):
+        if self.screen:
+            for (x, y), pulled in self.map.items():
+                self.screen.draw(x, y, '#' if pulled else '.')
+            self.screen.flush(force=True)
+            return
         for y in range(self.offset_y, self.offset_y + self.height):
             print(
                 y,
@@ -113,6 +96,69 @@ class DroidControl:
                 ).replace('0', '.').replace('1', '#')
             )
 
+class FrameBuffer:
+
+    def __init__(self, stream: TextIO = sys.stdout, max_fps: Optional[float] = 30) -> None:
+        '''
+        Dense screen of one byte per cell, which grows in every
+        direction as cells are drawn outside of it. flush() writes
+        to stream only the cells changed since the previous flush,
+        moving the cursor to them with ANSI escape sequences, and
+        does nothing if called more than max_fps times per second
+        (changes are kept until the next actual flush).
+        '''
+        self.stream = stream
+        self.max_fps = max_fps
+        self.left = 0
+        self.top = 0
+        self.width = 0
+        self.height = 0
+        self.cells = bytearray()
+        self.dirty: Set[int] = set()
+        self.cleared = False
+        self.last_flush = 0.0
+
+    def resize(self, left: int, top: int, width: int, height: int) -> None:
+        cells = bytearray(b' ' * (width * height))
+        for y in range(self.height):
+            start = (y + self.top - top) * width + self.left - left
+            cells[start:start + self.width] = self.cells[y*self.width:(y+1)*self.width]
+        self.left, self.top, self.width, self.height = left, top, width, height
+        self.cells = cells
+        self.dirty = set(range(len(cells)))
+
+    def draw(self, x: int, y: int, char: str) -> None:
+        col, row = x - self.left, y - self.top
+        if not (0 <= col < self.width and 0 <= row < self.height):
+            if not self.width:
+                self.left, self.top = x, y
+            left, top = min(x, self.left), min(y, self.top)
+            right = max(x + 1, self.left + self.width)
+            bottom = max(y + 1, self.top + self.height)
+            self.resize(left, top, right - left, bottom - top)
+            col, row = x - self.left, y - self.top
+        index = row * self.width + col
+        code = ord(char)
+        if self.cells[index] != code:
+            self.cells[index] = code
+            self.dirty.add(index)
+
+    def flush(self, status: str = '', force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and self.max_fps and now - self.last_flush < 1 / self.max_fps:
+            return
+        self.last_flush = now
+        out = [] if self.cleared else ['\x1b[2J']
+        self.cleared = True
+        for index in sorted(self.dirty):
+            y, x = divmod(index, self.width)
+            out.append(f'\x1b[{y+1};{x+1}H{chr(self.cells[index])}')
+        out.append(f'\x1b[{self.height+1};1H{status}\x1b[K\n')
+        self.stream.write(''.join(out))
+        self.stream.flush()
+        self.dirty.clear()
+
+
 class IntcodeComputer:
 
     def __init__(self) -> None:
@@ -311,42 +357,153 @@ class IntcodeComputer:
         return self.instructions[instruction].size
 
 
+class BeamProbe:
+
+    def __init__(self, program: Sequence[int], cache_size: Optional[int] = 4096) -> None:
+        '''
+        Callable which runs the drone program on a single
+        coordinate and returns 1 if it is pulled by the beam.
+        Results are kept in a LRU cache of cache_size coordinates
+        (unbounded if cache_size is None), so coordinates already
+        probed don't run the program again.
+        '''
+        self.program = program
+        self.computer = IntcodeComputer()
+        self.coords: List[int] = []
+        self.result = 0
+        self.cache: MutableMapping[Tuple[int, int], int] = OrderedDict()
+        self.cache_size = cache_size
+        self.probes = 0  # actual runs of the program
+        self.hits = 0
+
+    def process(self, program_output: int) -> None:
+        self.result = program_output
+
+    def send(self) -> List[int]:
+        return self.coords
+
+    def __call__(self, x: int, y: int) -> int:
+        try:
+            result = self.cache[(x, y)]
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            self.cache.move_to_end((x, y))
+            return result
+        self.coords = [x, y]
+        self.probes += 1
+        self.computer.run_program(Program(self.program, 0, [], 0, self, self))
+        self.cache[(x, y)] = self.result
+        if self.cache_size is not None and len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return self.result
+
+
+def track_edges(probe: Callable[[int, int], int], height: int) -> List[Optional[Tuple[int, int]]]:
+    '''
+    Follow the left and the right edge of the beam row by row.
+    Since the beam is a cone, each edge only moves a few cells
+    between two rows, so only O(height) probes are needed.
+    Return for every row the (left, right) edges, both included,
+    or None if the beam doesn't cross the row (which can happen
+    near the emitter, where the beam is thinner than a cell).
+    '''
+    edges: List[Optional[Tuple[int, int]]] = []
+    left = right = 0
+    for y in range(height):
+        x = left
+        limit = right + (right - left) + 2 if edges and edges[-1] else 10 * (y + 1)
+        while x <= limit and not probe(x, y):
+            x += 1
+        if x > limit:
+            edges.append(None)
+            continue
+        left = x
+        x = max(right, left)
+        while probe(x + 1, y):
+            x += 1
+        right = x
+        edges.append((left, right))
+    return edges
+
+
+def row_edges(probe: Callable[[int, int], int], y: int, slopes: Tuple[float, float]) -> Tuple[int, int]:
+    '''
+    Find the edges of the beam on row y without knowing the rows
+    above it: start from the center of the beam as estimated by
+    slopes and gallop toward each edge, then bisect.
+    '''
+    center = int(y * (slopes[0] + slopes[1]) / 2)
+    if not probe(center, y):
+        # estimate is off: look for the beam around it
+        offset = 1
+        while not probe(center + offset, y):
+            offset = -offset if offset > 0 else -offset + 1
+        center += offset
+    edges = []
+    for direction in (-1, 1):
+        inside, step = center, 1
+        while probe(inside + direction * step, y):
+            inside += direction * step
+            step *= 2
+        outside = inside + direction * step
+        while abs(outside - inside) > 1:
+            middle = (inside + outside) // 2
+            if probe(middle, y):
+                inside = middle
+            else:
+                outside = middle
+        edges.append(inside)
+    return edges[0], edges[1]
+
+
+def find_square(probe: Callable[[int, int], int], size: int, slopes: Tuple[float, float]) -> Tuple[int, int]:
+    '''
+    Return the top left corner of the square of side size closest
+    to the emitter which fits entirely in the beam.
+    The top row of the square is found by galloping and then bisecting
+    over the rows, each one checked with a handful of probes.
+    '''
+    def fits(y: int) -> bool:
+        return row_edges(probe, y, slopes)[1] - row_edges(probe, y + size - 1, slopes)[0] + 1 >= size
+
+    low, high = size, 2 * size
+    while not fits(high):
+        low, high = high, 2 * high
+    while high - low > 1:
+        middle = (low + high) // 2
+        if fits(middle):
+            high = middle
+        else:
+            low = middle
+    # the edges are rounded to whole cells, so fits() is not monotonic:
+    # a row a little above the one found may fit while the rows between
+    # don't, take the first row that fits among the size rows above
+    high = next(y for y in range(max(high - size, size), high + 1) if fits(y))
+    return row_edges(probe, high + size - 1, slopes)[0], high
+
+
 def run():
     with open('input.txt', encoding='utf-8') as fh:
         program = [int(code) for code in fh.read().split(',') if code]
-    computer = IntcodeComputer()
 
+    probe = BeamProbe(program)
+    edges = track_edges(probe, 50)
     control = DroidControl()
-    for i in range(50*50):
-        computer.run_program(Program(program, 0, [], 0, control, control))
+    #control.screen = FrameBuffer()
+    for y, row in enumerate(edges):
+        if row:
+            for x in range(row[0], min(row[1], 49) + 1):
+                control.map[(x, y)] = 1
+                control.regions_affected += 1
     print(control.regions_affected)  # first answer
     control.render_map()
 
-    control.map.clear()
-    control.offset_x = 0
-    control.offset_y = 0
-    control.last_coords = ()
-    found = False
-    while not found:
-        offset_x = control.offset_x
-        offset_y = control.offset_y
-        control.last_coords = ()
-        control.offset_x += 99
-        computer.run_program(Program(program, 0, [], 0, control, control))
-        if control.map[control.last_coords] == 1:
-            control.last_coords = ()
-            control.offset_x -= 99
-            control.offset_y += 99
-            computer.run_program(Program(program, 0, [], 0, control, control))
-            if control.map[control.last_coords] == 1:
-                found = True
-                print(f'{offset_x * 10000 + offset_y}')  # second answer
-            else:
-                offset_x += 1
-        else:
-            offset_y += 1
-        control.offset_x = offset_x
-        control.offset_y = offset_y
+    last_row = max(y for y, row in enumerate(edges) if row)
+    slopes = (edges[last_row][0] / last_row, (edges[last_row][1] + 1) / last_row)
+    x, y = find_square(probe, 100, slopes)
+    print(f'{x * 10000 + y}')  # second answer
 
 
 if __name__ == '__main__':
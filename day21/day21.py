@@ -1,9 +1,13 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-from typing import Sequence, Optional, Callable, List, Union, Any, MutableMapping, Set
+from typing import Sequence, Optional, Callable, List, Union, Any, MutableMapping, Set, TextIO, Tuple, Dict
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import combinations, repeat
 from copy import deepcopy
+import io, sys
 
 
 class InvalidInstruction(Exception):
@@ -12,6 +16,9 @@ class InvalidInstruction(Exception):
 class EndProgram(Exception):
     pass
 
+class InputRequest(Exception):
+    pass
+
 
 class Instruction:
 
@@ -70,13 +77,47 @@ class Program:
         )
 
 
-class AsciiPrinter:
+class AsciiChannel:
+
+    def __init__(self, separator: bytes = b'\n', stream: Optional[TextIO] = sys.stdout) -> None:
+        '''
+        Output recipient for programs which talk ASCII: the values
+        output are collected in a bytearray, and every time the data
+        collected ends with separator (a line, or a frame of a video
+        feed with b'\n\n') it is passed to receive() as a memoryview,
+        valid only during the call. Values above 127 are not text,
+        and are passed to number() instead.
+        Both write to stream, if there is one.
+        '''
+        self.separator = separator
+        self.stream = stream
+        self.buffer = bytearray()
+        self.numbers: List[int] = []
 
     def process(self, output: int) -> None:
-        if output > 128:
-            print(output)
-        else:
-            print(chr(output), end='')
+        if output > 127:
+            self.number(output)
+            return
+        self.buffer.append(output)
+        if output == self.separator[-1] and self.buffer.endswith(self.separator):
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.buffer:
+            return
+        with memoryview(self.buffer) as data:
+            self.receive(data)
+        self.buffer.clear()
+
+    def receive(self, data: memoryview) -> None:
+        if self.stream:
+            self.stream.write(str(data, 'ascii'))
+
+    def number(self, value: int) -> None:
+        self.flush()
+        self.numbers.append(value)
+        if self.stream:
+            self.stream.write(f'{value}\n')
 
 
 class IntcodeComputer:
@@ -277,40 +318,188 @@ class IntcodeComputer:
         return self.instructions[instruction].size
 
 
+class Prompt:
+
+    def send(self) -> List[int]:
+        raise InputRequest
+
+
+def snapshot(program: Sequence[int]) -> Program:
+    '''
+    Run program until it asks for the springscript, and return
+    a Program which resumes it from there.
+    '''
+    computer = IntcodeComputer()
+    try:
+        computer.run_program(Program(program, 0, [], 0, AsciiChannel(stream=None), Prompt()))
+    except InputRequest:
+        pass
+    resume = Program([], computer.instruction_pointer, [], computer.relative_base)
+    resume.memory = computer.memory
+    return resume
+
+def try_script(resume: Program, script: str) -> Tuple[Optional[int], str]:
+    '''
+    Feed script to a clone of resume. Return the hull damage
+    reported, or None and the hull the droid fell into.
+    '''
+    channel = AsciiChannel(stream=io.StringIO())
+    program = Program([], resume.instruction_pointer, [ord(c) for c in script], resume.relative_base, channel, None)
+    program.memory = resume.memory  # copied by load_program
+    IntcodeComputer().run_program(program)
+    channel.flush()
+    if channel.numbers:
+        return channel.numbers[-1], ''
+    hulls = [line for line in channel.stream.getvalue().split('\n') if line and set(line) <= set('#.@') and '#' in line]
+    return None, hulls[0].replace('@', '.') if hulls else ''
+
+
+Springscript = List[Tuple[str, str, str]]
+
+@lru_cache(maxsize=None)
+def sensor_tables(sensors: str) -> Dict[str, int]:
+    readings = 1 << len(sensors)
+    return {
+        sensor: sum(1 << reading for reading in range(readings) if reading >> i & 1)
+        for i, sensor in enumerate(sensors)
+    }
+
+def jump_table(script: Springscript, sensors: str) -> int:
+    '''
+    Run script on every reading of sensors at once: each register
+    is a bitmask with a bit for every reading (bit i of the
+    reading is sensor i, 1 for ground), set if the register
+    would be true after that reading. Return J.
+    '''
+    registers = {'T': 0, 'J': 0}
+    registers.update(sensor_tables(sensors))
+    true = (1 << (1 << len(sensors))) - 1
+    for op, x, y in script:
+        if op == 'AND':
+            registers[y] &= registers[x]
+        elif op == 'OR':
+            registers[y] |= registers[x]
+        else:
+            registers[y] = registers[x] ^ true
+    return registers['J']
+
+
+class HullCache:
+
+    def __init__(self, sensors: str) -> None:
+        '''
+        Hulls droids fell into, each kept with the sensors
+        reading from every tile of it, so a springscript
+        is checked against them with just its jump table.
+        The hull which rejected the last candidate is moved
+        to the front, as it is likely to reject the next.
+        '''
+        self.sensors = len(sensors)
+        self.hulls: List[Tuple[str, List[int]]] = []
+        self.checks = 0
+        self.rejections = 0
+
+    def add(self, hull: str) -> None:
+        if not hull or any(hull == known for known, _ in self.hulls):
+            return
+        ground = [c == '#' for c in hull] + [True] * self.sensors
+        readings = [
+            sum(1 << i for i in range(self.sensors) if ground[pos + 1 + i])
+            for pos in range(len(hull))
+        ]
+        self.hulls.insert(0, (hull, readings))
+
+    def rejects(self, table: int) -> bool:
+        self.checks += 1
+        for index, (hull, readings) in enumerate(self.hulls):
+            pos = 0
+            while pos < len(hull):
+                if hull[pos] == '.':
+                    self.rejections += 1
+                    if index:
+                        self.hulls.insert(0, self.hulls.pop(index))
+                    return True
+                pos += 4 if table >> readings[pos] & 1 else 1
+        return False
+
+def candidate_scripts(sensors: str, max_length: int = 15) -> List[Springscript]:
+    '''
+    Springscripts (without WALK or RUN) which jump if there is a
+    hole in any of holes, there is ground in all of landing and
+    (if any) there is ground in any of after, shortest first.
+    The droid jumps 4 tiles, so holes are among A-C, landing
+    among D and what follows, and after among what follows D.
+    '''
+    scripts = []
+    for h in range(1, 4):
+        for holes in combinations(sensors[:3], h):
+            for l in range(len(sensors) - 2):
+                for landing in combinations(sensors[3:], l):
+                    for a in range(len(sensors) - 3):
+                        for after in combinations(sensors[4:], a):
+                            script = [('NOT', holes[0], 'J')]
+                            for hole in holes[1:]:
+                                script.extend((('NOT', hole, 'T'), ('OR', 'T', 'J')))
+                            script.extend(('AND', sensor, 'J') for sensor in landing)
+                            if after:
+                                script.extend((('NOT', after[0], 'T'), ('NOT', 'T', 'T')))
+                                script.extend(('OR', sensor, 'T') for sensor in after[1:])
+                                script.append(('AND', 'T', 'J'))
+                            if len(script) <= max_length:
+                                scripts.append(script)
+    scripts.sort(key=len)
+    return scripts
+
+def search(program: Sequence[int], mode: str, workers: int = 0) -> Optional[Tuple[int, str]]:
+    '''
+    Try the candidate springscripts for mode (WALK or RUN) on the
+    droid program, resumed every time from the point where it asks
+    for the script. Candidates which would fall into a hull some
+    other candidate fell into are skipped without running them
+    (see HullCache).
+    With workers > 0 the candidates are tried that many at a time
+    in a process pool. Return the hull damage and the first
+    springscript which got the droid across, or None if no
+    candidate did.
+    '''
+    sensors = 'ABCD' if mode == 'WALK' else 'ABCDEFGHI'
+    resume = snapshot(program)
+    hulls = HullCache(sensors)
+    candidates = iter(candidate_scripts(sensors))
+    pool = ProcessPoolExecutor(workers) if workers else None
+    try:
+        while True:
+            batch = []
+            for script in candidates:
+                if not hulls.rejects(jump_table(script, sensors)):
+                    batch.append(''.join(f'{op} {x} {y}\n' for op, x, y in script) + mode + '\n')
+                    if len(batch) == max(workers, 1):
+                        break
+            if not batch:
+                return None
+            results = pool.map(try_script, repeat(resume), batch) if pool else map(try_script, repeat(resume), batch)
+            for script, (damage, hull) in zip(batch, results):
+                if damage is not None:
+                    return damage, script
+                hulls.add(hull)
+    finally:
+        if pool:
+            pool.shutdown()
+
+
 def run():
     with open('input.txt', encoding='utf-8') as fh:
         program = [int(code) for code in fh.read().split(',')]
-    computer = IntcodeComputer()
 
-    springscript = [
-        ord(c) for c in
-        'NOT A J\n'
-        'NOT B T\n'
-        'OR T J\n'
-        'NOT C T\n'
-        'OR T J\n'
-        'AND D J\n'
-        'WALK\n'
-    ]
-
-    computer.run_program(Program(program, 0, springscript, 0, AsciiPrinter(), None))
-
-    springscript = [
-        ord(c) for c in
-        'NOT A J\n'
-        'NOT B T\n'
-        'OR T J\n'
-        'NOT C T\n'
-        'OR T J\n'
-        'AND D J\n'
-        'NOT E T\n'
-        'NOT T T\n'
-        'OR H T\n'
-        'AND T J\n'
-        'RUN\n'
-    ]
-
-    computer.run_program(Program(program, 0, springscript, 0, AsciiPrinter(), None))
+    for mode in ('WALK', 'RUN'):
+        result = search(program, mode)
+        #result = search(program, mode, workers=4)
+        if result is None:
+            print(f'No springscript gets the droid across in {mode} mode')
+            continue
+        damage, script = result
+        print(script)
+        print(damage)
 
 
 if __name__ == '__main__':
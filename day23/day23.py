@@ -4,11 +4,13 @@
 
 from typing import (
     Sequence, Optional, Callable, List, Union, Any,
-    MutableSequence, DefaultDict, Deque, Dict
+    MutableSequence, DefaultDict, Deque, Dict, TextIO, Tuple
 )
 from collections import defaultdict, deque
 from copy import deepcopy
-import threading, time, os
+from multiprocessing import shared_memory
+import multiprocessing as mp
+import threading, time, os, sys, json
 
 
 class InvalidInstruction(Exception):
@@ -105,6 +107,7 @@ class IntcodeComputer:
         self.program_to_freeze: List[int] = []
         self.output_recipient = None
         self.input_source = None
+        self.executed = 0  # instructions executed so far
 
     def add_program(self, program: Program) -> None:
         self.programs.append(program)
@@ -142,6 +145,7 @@ class IntcodeComputer:
             # print(f'BEFORE\nrunning program index {self.running_program}')
             # self.programs[self.running_program].dump_program()
             offset = self.compute()
+            self.executed += 1
             if offset and not self.program_to_freeze:
                 self.instruction_pointer += offset
             # print(f'AFTER\nrunning program index {self.running_program}')
@@ -280,29 +284,54 @@ class IntcodeComputer:
 
 class NetworkInterfaceController:
 
-    def __init__(self) -> None:
+    def __init__(self, telemetry_stream: Optional[TextIO] = None) -> None:
         '''
-        Packets are received one bit at a time in self.packets.
+        Packets are received one bit at a time in the preallocated
+        triples of self.packets (self.received counts the values
+        already written in each of them).
         When they are complete, they are moved to self.sender,
-        and then sent to clients on demand.
+        and then sent to clients on demand, all the queued ones at once.
+        The telemetry counters are returned by self.snapshot(); if
+        telemetry_stream is given, a snapshot is written to it
+        as a JSON line at every idle check.
         '''
-        self.packets: Dict[int, List[List[int]]] = { dest: [] for dest in range(50) }
+        self.packets: Dict[int, List[int]] = { dest: [0, 0, 0] for dest in range(50) }
+        self.received: Dict[int, int] = { dest: 0 for dest in range(50) }
         self.sender: Dict[int, Deque[List[int]]] = { dest: deque() for dest in range(50) }
         self.NAT: List[int] = []
         self.prev_NATY: Optional[int] = None
         self.last_packet: Dict[int, List[int]] = { dest: [] for dest in range(50) }
         self.first_255: Optional[int] = None
         self.lock = threading.RLock()
+        self.start_time = time.monotonic()
+        self.packets_sent: DefaultDict[int, int] = defaultdict(int)
+        self.packets_received: DefaultDict[int, int] = defaultdict(int)
+        self.queue_depths: Deque[Tuple[float, int]] = deque(maxlen=1000)
+        # time of the last packet sent or delivered: an idle period
+        # lasts from there to the NAT restart
+        self.last_traffic = self.start_time
+        self.idle_periods: List[float] = []
+        self.NAT_restarts = 0
+        # histogram of the VM instructions executed by a NIC between
+        # two received batches, bucketed by powers of two
+        self.instructions_between_packets: DefaultDict[int, int] = defaultdict(int)
+        self.telemetry_stream = telemetry_stream
 
     def restart_if_idle(self) -> None:
         with self.lock:
-            if self._is_idle() and self.NAT:
+            idle = self._is_idle()
+            if idle and self.NAT:
                 try:
                     if self.prev_NATY == self.NAT[1]:
                         print(f'First Y value sent by the NAT twice in a row: {self.NAT[1]}')  # second answer
+                        self.emit_telemetry()
                         os._exit(0)  # quick and dirty exit
                 except IndexError:
                     pass
+                now = time.monotonic()
+                self.idle_periods.append(now - self.last_traffic)
+                self.last_traffic = now
+                self.NAT_restarts += 1
                 self.sender[0].append([0] + self.NAT)
                 self.prev_NATY = self.NAT[1]
                 self.NAT.clear()
@@ -313,65 +342,360 @@ class NetworkInterfaceController:
                 print(f'First Y value sent to 255: {packet[1]}')  # first answer
                 self.first_255 = packet[1]
             self.NAT = packet[:]
+            self.last_traffic = time.monotonic()
 
     def update_sender(self, packet: List[int]) -> None:
         with self.lock:
             self.sender[packet[0]].append(packet[:])
+            self.last_traffic = time.monotonic()
 
     def retrieve_packet(self, ip: int) -> List[int]:
         with self.lock:
-            try:
-                packet = self.sender[ip].popleft()[1:]
-            except IndexError:
-                packet = [-1]
+            packet = [value for queued in self.sender[ip] for value in queued[1:]] or [-1]
+            if self.sender[ip]:
+                self.packets_received[ip] += len(self.sender[ip])
+                self.sender[ip].clear()
+                self.last_traffic = time.monotonic()
             self.last_packet[ip] = packet
-            return packet
+        if packet == [-1]:
+            time.sleep(0.001)  # don't starve the other NICs while polling
+        return packet
 
     def _is_idle(self) -> bool:
         with self.lock:
-            if any(self.sender.values()) or any(self.packets.values()) \
+            if any(self.sender.values()) or any(self.received.values()) \
                     or not all((packet == [-1] for packet in self.last_packet.values())):
                 return False
             return True
 
+    def record_sent(self, ip: int) -> None:
+        with self.lock:
+            self.packets_sent[ip] += 1
+
+    def record_instructions(self, executed: int) -> None:
+        with self.lock:
+            self.instructions_between_packets[executed.bit_length()] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'elapsed': time.monotonic() - self.start_time,
+                'packets_sent': dict(self.packets_sent),
+                'packets_received': dict(self.packets_received),
+                'queue_depth': sum(len(queue) for queue in self.sender.values()),
+                'queue_depths': list(self.queue_depths),
+                'idle_periods': self.idle_periods[:],
+                'NAT_restarts': self.NAT_restarts,
+                'instructions_between_packets': {
+                    # bucket upper bounds
+                    2**bucket: count for bucket, count in sorted(self.instructions_between_packets.items())
+                }
+            }
+
+    def emit_telemetry(self) -> None:
+        if self.telemetry_stream:
+            self.telemetry_stream.write(json.dumps(self.snapshot()) + '\n')
+            self.telemetry_stream.flush()
+
     def check_idle(self) -> None:
         while True:
             time.sleep(0.1)
+            with self.lock:
+                self.queue_depths.append((
+                    time.monotonic() - self.start_time,
+                    sum(len(queue) for queue in self.sender.values())
+                ))
             self.restart_if_idle()
+            self.emit_telemetry()
 
 
 class Client:
 
-    def __init__(self, ip: int, net: NetworkInterfaceController) -> None:
+    def __init__(
+            self,
+            ip: int,
+            net: NetworkInterfaceController,
+            computer: Optional[IntcodeComputer] = None
+    ) -> None:
+        '''
+        If computer is given, the instructions it executes between
+        two received batches of packets are recorded in the net telemetry.
+        '''
         self.ip = ip
         self.net = net
+        self.computer = computer
+        self.last_executed = 0
 
     def process(self, output: int) -> None:
         #print(f'{self.ip} is sending {output}')
-        if not self.net.packets.get(self.ip):
-            self.net.packets[self.ip].append([])
-        packet = self.net.packets[self.ip][-1]
-        packet.append(output)
-        if len(packet) == 3:
-            if packet[0] == 255:
-                self.net.update_NAT(packet[1:])
-            else:
-                self.net.update_sender(packet)
-            del self.net.packets[self.ip][-1]
+        packet = self.net.packets[self.ip]
+        received = self.net.received[self.ip]
+        packet[received] = output
+        if received < 2:
+            self.net.received[self.ip] = received + 1
+            return
+        if packet[0] == 255:
+            self.net.update_NAT(packet[1:])
+        else:
+            self.net.update_sender(packet)
+        self.net.received[self.ip] = 0
+        self.net.record_sent(self.ip)
 
     def send(self) -> List[int]:
-        return self.net.retrieve_packet(self.ip)
+        packet = self.net.retrieve_packet(self.ip)
+        if self.computer and packet != [-1]:
+            self.net.record_instructions(self.computer.executed - self.last_executed)
+            self.last_executed = self.computer.executed
+        return packet
+
+
+class PacketRing:
+
+    def __init__(self, capacity: int = 1024) -> None:
+        '''
+        Fixed size ring buffer of (dest, x, y) int64 triples in shared memory.
+        The first slot holds the head counter, which is only written
+        by the consumer, the second one the tail counter, which is only
+        written by the producer: as long as each end is used by a single
+        process at a time, no interprocess lock is needed.
+        '''
+        self.capacity = capacity
+        self.shm = shared_memory.SharedMemory(create=True, size=(2 + 3 * capacity) * 8)
+        self._attach()
+        self.slots[0] = self.slots[1] = 0
+
+    def _attach(self) -> None:
+        self.slots = self.shm.buf.cast('q')
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return { 'capacity': self.capacity, 'shm': self.shm }
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._attach()
+
+    def push(self, dest: int, x: int, y: int) -> bool:
+        tail = self.slots[1]
+        if tail - self.slots[0] == self.capacity:
+            return False
+        i = 2 + 3 * (tail % self.capacity)
+        self.slots[i], self.slots[i+1], self.slots[i+2] = dest, x, y
+        self.slots[1] = tail + 1  # publish the packet only after it's written
+        return True
+
+    def pop_all(self) -> List[List[int]]:
+        head, tail = self.slots[0], self.slots[1]
+        packets = []
+        for n in range(head, tail):
+            i = 2 + 3 * (n % self.capacity)
+            packets.append([self.slots[i], self.slots[i+1], self.slots[i+2]])
+        self.slots[0] = tail
+        return packets
+
+    def __len__(self) -> int:
+        return self.slots[1] - self.slots[0]
+
+    def close(self, unlink: bool = False) -> None:
+        self.slots.release()
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+class WorkerNIC(NetworkInterfaceController):
+
+    def __init__(
+            self,
+            worker: int,
+            rings: Sequence[Sequence[PacketRing]],
+            status: Any
+    ) -> None:
+        '''
+        Network interface of a worker process. Packets for the nodes
+        hosted by this worker stay in self.sender; all the others are
+        pushed in the ring from this worker to the one owning the
+        destination. rings[src][dest] is the ring from worker src
+        to worker dest; the last index belongs to the NAT,
+        which receives the packets addressed to 255.
+        The worker periodically publishes in status whether it is idle,
+        with the packets it pushed to and popped from the rings so far
+        (see publish_status).
+        '''
+        super().__init__()
+        self.worker = worker
+        self.workers = len(rings) - 1
+        self.rings = rings
+        self.status = status
+        self.hosted = [ip for ip in range(50) if owner(ip, self.workers) == worker]
+        self.last_packet = { ip: [] for ip in self.hosted }
+        self.pushed = 0
+        self.popped = 0
+        self.published = 0
+
+    def _push(self, dest: int, packet: List[int]) -> None:
+        while True:
+            with self.lock:
+                if self.rings[self.worker][dest].push(*packet):
+                    self.pushed += 1
+                    return
+                # the ring is full: keep taking in packets while waiting,
+                # so that a worker filling its ring to us can go on
+                self._drain()
+            time.sleep(0.001)
+
+    def _drain(self) -> None:
+        with self.lock:
+            for src in range(self.workers + 1):
+                for packet in self.rings[src][self.worker].pop_all():
+                    self.sender[packet[0]].append(packet)
+                    self.popped += 1
+
+    def update_NAT(self, packet: List[int]) -> None:
+        self._push(self.workers, [255] + packet)
+
+    def update_sender(self, packet: List[int]) -> None:
+        dest = owner(packet[0], self.workers)
+        if dest == self.worker:
+            super().update_sender(packet)
+        else:
+            self._push(dest, packet)
 
+    def retrieve_packet(self, ip: int) -> List[int]:
+        self._drain()
+        return super().retrieve_packet(ip)
 
-def run():
+    def publish_status(self) -> None:
+        '''
+        Write [sequence, idle, pushed, popped] in this worker's slots
+        of status. idle and the counters are read together under
+        the lock; the sequence is odd while the slots are being
+        written, and grows at every publication.
+        '''
+        with self.lock:
+            self._drain()
+            idle = self._is_idle()
+            pushed, popped = self.pushed, self.popped
+        base = 4 * self.worker
+        self.published += 1
+        self.status[base] = 2 * self.published - 1
+        self.status[base + 1] = idle
+        self.status[base + 2] = pushed
+        self.status[base + 3] = popped
+        self.status[base] = 2 * self.published
+
+    def check_idle(self) -> None:
+        while True:
+            time.sleep(0.005)
+            self.publish_status()
+
+
+def owner(ip: int, workers: int) -> int:
+    return ip % workers
+
+
+def read_status(status: Any, worker: int) -> Tuple[int, int, int, int]:
+    base = 4 * worker
+    while True:
+        sequence = status[base]
+        values = tuple(status[base:base + 4])
+        if not sequence % 2 and values[0] == sequence:
+            return values
+
+
+def run_worker(
+        program: Sequence[int],
+        worker: int,
+        rings: Sequence[Sequence[PacketRing]],
+        status: Any
+) -> None:
+    NIC = WorkerNIC(worker, rings, status)
+    for t in NIC.hosted:
+        c = IntcodeComputer()
+        client = Client(t, NIC, c)
+        p = Program(program[:], 0, [t], 0, client, client)
+        threading.Thread(target=c.run_program, args=(p,), daemon=True).start()
+    NIC.check_idle()
+
+
+def run_multiprocess(program: Sequence[int], workers: int) -> int:
+    '''
+    Run the 50 NICs on a pool of worker processes, each hosting
+    a slice of the network. The calling process acts as the NAT:
+    it collects the packets sent to 255 and restarts the network
+    when it is idle. As the statuses of the workers are read one
+    at a time, the network is only taken for idle when two rounds
+    of fresh statuses all report idle workers, with the same
+    counters, and every packet pushed in a ring has been popped.
+    Return the first Y value sent by the NAT twice in a row.
+    '''
+    rings = [[PacketRing() for dest in range(workers + 1)] for src in range(workers + 1)]
+    status = mp.RawArray('q', 4 * workers)
+    processes = [
+        mp.Process(target=run_worker, args=(program, w, rings, status), daemon=True)
+        for w in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    NAT: List[int] = []
+    first_255: Optional[int] = None
+    prev_NATY: Optional[int] = None
+    pushed = popped = 0  # by the NAT
+    previous_round: Optional[List[Tuple[int, int, int, int]]] = None
+    try:
+        while True:
+            time.sleep(0.005)
+            for src in range(workers):
+                for packet in rings[src][workers].pop_all():
+                    popped += 1
+                    if first_255 is None:
+                        first_255 = packet[2]
+                        print(f'First Y value sent to 255: {first_255}')  # first answer
+                    NAT = packet[1:]
+            current_round = [read_status(status, w) for w in range(workers)]
+            idle = bool(NAT) and all(idle for _, idle, _, _ in current_round) \
+                and pushed + sum(p for _, _, p, _ in current_round) == popped + sum(p for _, _, _, p in current_round)
+            confirmed = idle and previous_round is not None and all(
+                new[0] > old[0] and new[2:] == old[2:]
+                for new, old in zip(current_round, previous_round)
+            )
+            previous_round = current_round if idle else None
+            if not confirmed:
+                continue
+            if prev_NATY == NAT[1]:
+                print(f'First Y value sent by the NAT twice in a row: {NAT[1]}')  # second answer
+                return NAT[1]
+            while not rings[workers][owner(0, workers)].push(0, *NAT):
+                time.sleep(0.001)
+            pushed += 1
+            prev_NATY = NAT[1]
+            NAT = []
+            previous_round = None
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+        for row in rings:
+            for ring in row:
+                ring.close(unlink=True)
+
+
+def run(workers: int = 0, telemetry: Optional[str] = None):
     with open('input.txt', encoding='utf-8') as fh:
         program = [int(code) for code in fh.read().split(',')]
 
-    NIC = NetworkInterfaceController()
+    if workers:
+        if telemetry:
+            raise ValueError('telemetry is only collected by the threaded network (workers=0)')
+        run_multiprocess(program, workers)
+        return
+
+    NIC = NetworkInterfaceController(
+        open(telemetry, 'w', encoding='utf-8') if telemetry else None
+    )
 
     for t in range(50):
         c = IntcodeComputer()
-        client = Client(t, NIC)
+        client = Client(t, NIC, c)
         p = Program(program[:], 0, [t], 0, client, client)
         threading.Thread(target=c.run_program, args=(p,)).start()
     
@@ -379,4 +703,7 @@ def run():
 
 
 if __name__ == '__main__':
-    run()
+    run(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 0,
+        sys.argv[2] if len(sys.argv) > 2 else None
+    )
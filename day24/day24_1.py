@@ -2,21 +2,152 @@
 # -*- coding: utf-8 -*-
 
 
-from typing import Tuple, MutableMapping
+from typing import Tuple, Optional, List, Union, Any, Iterator
 from collections import defaultdict
 
 
+class Grid:
+
+    movements = (0 - 1j, 0 + 1j, -1 + 0j, 1 + 0j)
+
+    def __init__(self, default: Union[str, int] = ' ') -> None:
+        '''
+        Dense 2-D map of one byte per cell (a character or a small
+        int, like default), indexed by complex coordinates, which
+        grows in every direction as cells are set outside of it.
+        A border of default cells is always kept around the
+        bounding box of the cells set, so the neighbours of any
+        cell inside it are plain index offsets. Cells never set
+        read as default, but (unlike a defaultdict) reading them
+        does not add them to the map.
+        '''
+        self.text = isinstance(default, str)
+        self.default = ord(default) if self.text else default
+        self.left = 0
+        self.top = 0
+        self.width = 0
+        self.height = 0
+        self.cells = bytearray()
+        self.bounds: Optional[Tuple[int, int, int, int]] = None  # min x, min y, max x, max y
+
+    def resize(self, left: int, top: int, width: int, height: int) -> None:
+        cells = bytearray([self.default]) * (width * height)
+        for y in range(self.height):
+            start = (y + self.top - top) * width + self.left - left
+            cells[start:start + self.width] = self.cells[y*self.width:(y+1)*self.width]
+        self.left, self.top, self.width, self.height = left, top, width, height
+        self.cells = cells
+
+    def index(self, pos: complex) -> int:
+        col, row = int(pos.real) - self.left, int(pos.imag) - self.top
+        if 0 <= col < self.width and 0 <= row < self.height:
+            return row * self.width + col
+        return -1
+
+    def __getitem__(self, pos: complex) -> Union[str, int]:
+        col, row = int(pos.real) - self.left, int(pos.imag) - self.top
+        if 0 <= col < self.width and 0 <= row < self.height:
+            code = self.cells[row * self.width + col]
+        else:
+            code = self.default
+        return chr(code) if self.text else code
+
+    def __setitem__(self, pos: complex, value: Union[str, int]) -> None:
+        x, y = int(pos.real), int(pos.imag)
+        code = ord(value) if self.text else value
+        if self.bounds and self.bounds[0] <= x <= self.bounds[2] and self.bounds[1] <= y <= self.bounds[3]:
+            self.cells[(y - self.top) * self.width + x - self.left] = code
+            return
+        if self.bounds is None:
+            self.bounds = (x, y, x, y)
+        else:
+            min_x, min_y, max_x, max_y = self.bounds
+            self.bounds = (min(x, min_x), min(y, min_y), max(x, max_x), max(y, max_y))
+        min_x, min_y, max_x, max_y = self.bounds
+        if (min_x <= self.left or min_y <= self.top or
+                max_x >= self.left + self.width - 1 or max_y >= self.top + self.height - 1):
+            margin_x = (max_x - min_x) // 2 + 1
+            margin_y = (max_y - min_y) // 2 + 1
+            self.resize(
+                min_x - margin_x, min_y - margin_y,
+                max_x - min_x + 1 + 2 * margin_x, max_y - min_y + 1 + 2 * margin_y
+            )
+        self.cells[(y - self.top) * self.width + x - self.left] = code
+
+    def __contains__(self, pos: complex) -> bool:
+        if self.bounds is None:
+            return False
+        min_x, min_y, max_x, max_y = self.bounds
+        return min_x <= pos.real <= max_x and min_y <= pos.imag <= max_y
+
+    def get(self, pos: complex, default: Any = None) -> Any:
+        return self[pos] if pos in self else default
+
+    def __iter__(self) -> Iterator[complex]:
+        if self.bounds is None:
+            return
+        min_x, min_y, max_x, max_y = self.bounds
+        for y in range(min_y, max_y + 1):
+            for x in range(min_x, max_x + 1):
+                yield complex(x, y)
+
+    def items(self) -> Iterator[Tuple[complex, Union[str, int]]]:
+        if self.bounds is None:
+            return
+        min_x, min_y = self.bounds[:2]
+        for y, row in enumerate(self.rows(), min_y):
+            for x, value in enumerate(row, min_x):
+                yield complex(x, y), value
+
+    def values(self) -> List[Union[str, int]]:
+        return [value for row in self.rows() for value in row]
+
+    def rows(self) -> List[Union[str, bytes]]:
+        '''
+        The cells inside the bounding box, one row at a time
+        (strings if the grid holds characters).
+        '''
+        if self.bounds is None:
+            return []
+        min_x, min_y, max_x, max_y = self.bounds
+        rows = []
+        for y in range(min_y - self.top, max_y - self.top + 1):
+            start = y * self.width + min_x - self.left
+            row = bytes(self.cells[start:start + max_x - min_x + 1])
+            rows.append(row.decode('latin-1') if self.text else row)
+        return rows
+
+    def neighbours(self, pos: complex) -> List[Union[str, int]]:
+        '''
+        Values of the cells north, south, west and east of pos.
+        '''
+        if pos not in self:
+            return [self[pos + move] for move in Grid.movements]
+        index = self.index(pos)
+        cells = self.cells
+        codes = (cells[index - self.width], cells[index + self.width], cells[index - 1], cells[index + 1])
+        return [chr(code) for code in codes] if self.text else list(codes)
+
+    def count_neighbours(self, pos: complex, value: Union[str, int]) -> int:
+        return self.neighbours(pos).count(value)
+
+    def copy(self) -> 'Grid':
+        grid = Grid.__new__(Grid)
+        grid.__dict__.update(self.__dict__)
+        grid.cells = self.cells.copy()
+        return grid
+
+
 class GameOfBugs:
 
-    neighbours = (-1j, 1j, -1, 1)
     twos_powers = { complex(n % 5, n // 5): 2 ** n for n in range(25) }
     
     def __init__(self, data: str) -> None:
         self.map, self.width, self.height = self._build_map(data)
 
-    def _build_map(self, data: str) -> Tuple[MutableMapping[complex, str], int, int]:
+    def _build_map(self, data: str) -> Tuple[Grid, int, int]:
         coords = 0j
-        map_ = {}
+        map_ = Grid()
         for c in data:
             if c == '\n':
                 width = int(coords.real)
@@ -36,10 +167,10 @@ class GameOfBugs:
         )
 
     def neighbour_bugs(self, pos: complex) -> int:
-        return sum(1 for n in self.neighbours if self.map.get(pos + n) == '#')
+        return self.map.count_neighbours(pos, '#')
 
     def next_step(self) -> None:
-        new_map = {}
+        new_map = Grid()
         for pos, c in self.map.items():
             neighbours = self.neighbour_bugs(pos)
             if c == '#':
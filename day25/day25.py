@@ -4,17 +4,22 @@
 
 from typing import (
     Sequence, Optional, Callable, List, Union, Any,
-    MutableSequence, DefaultDict, Deque, Dict
+    MutableSequence, DefaultDict, Deque, Dict, TextIO, Set, Tuple
 )
 from collections import defaultdict, deque
-from itertools import combinations
-from copy import deepcopy
-import sys
+from copy import copy, deepcopy
+import io, sys
 
 
 class InvalidInstruction(Exception):
     pass
 
+class InputRequest(Exception):
+    pass
+
+class Runaway(Exception):
+    pass
+
 
 class Instruction:
 
@@ -73,13 +78,47 @@ class Program:
         )
 
 
-class AsciiPrinter:
+class AsciiChannel:
+
+    def __init__(self, separator: bytes = b'\n', stream: Optional[TextIO] = sys.stdout) -> None:
+        '''
+        Output recipient for programs which talk ASCII: the values
+        output are collected in a bytearray, and every time the data
+        collected ends with separator (a line, or a frame of a video
+        feed with b'\n\n') it is passed to receive() as a memoryview,
+        valid only during the call. Values above 127 are not text,
+        and are passed to number() instead.
+        Both write to stream, if there is one.
+        '''
+        self.separator = separator
+        self.stream = stream
+        self.buffer = bytearray()
+        self.numbers: List[int] = []
 
     def process(self, output: int) -> None:
-        if output > 128:
-            print(output)
-        else:
-            print(chr(output), end='')
+        if output > 127:
+            self.number(output)
+            return
+        self.buffer.append(output)
+        if output == self.separator[-1] and self.buffer.endswith(self.separator):
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.buffer:
+            return
+        with memoryview(self.buffer) as data:
+            self.receive(data)
+        self.buffer.clear()
+
+    def receive(self, data: memoryview) -> None:
+        if self.stream:
+            self.stream.write(str(data, 'ascii'))
+
+    def number(self, value: int) -> None:
+        self.flush()
+        self.numbers.append(value)
+        if self.stream:
+            self.stream.write(f'{value}\n')
 
 
 class Console:
@@ -89,6 +128,203 @@ class Console:
         return [ord(c) for c in in_+'\n']
 
 
+class Prompt:
+
+    def send(self) -> List[int]:
+        raise InputRequest
+
+
+class Transcript(AsciiChannel):
+
+    def __init__(self, limit: int = 100000) -> None:
+        '''
+        Collect the text output, raising Runaway if it grows
+        past limit characters (the program went into a loop).
+        '''
+        super().__init__(stream=io.StringIO())
+        self.limit = limit
+
+    def receive(self, data: memoryview) -> None:
+        super().receive(data)
+        if self.stream.tell() > self.limit:
+            raise Runaway
+
+    def text(self) -> str:
+        self.flush()
+        return self.stream.getvalue()
+
+
+class Droid:
+
+    def __init__(self, program: Sequence[int]) -> None:
+        '''
+        The droid program, stopped every time it asks for
+        a command. A copy of a Droid can be sent commands
+        without affecting the original, so a command which went
+        wrong is undone by going back to the original.
+        '''
+        self.state = Program(program)
+        self.halted = False
+        self.output = self.command('')
+
+    def command(self, command: str) -> str:
+        '''
+        Send command and return the output of the program
+        up to the next request of a command.
+        '''
+        transcript = Transcript()
+        inputs = [ord(c) for c in command + '\n'] if command else []
+        program = Program([], self.state.instruction_pointer, inputs, self.state.relative_base, transcript, Prompt())
+        program.memory = self.state.memory  # copied by load_program
+        computer = IntcodeComputer()
+        try:
+            computer.run_program(program)
+            self.halted = True
+        except InputRequest:
+            pass
+        self.state = Program([], computer.instruction_pointer, [], computer.relative_base)
+        self.state.memory = computer.memory
+        self.output = transcript.text()
+        return self.output
+
+
+def parse_room(text: str) -> Tuple[str, List[str], List[str]]:
+    '''
+    Name, doors and items of the last room described in text.
+    '''
+    name, doors, items = '', [], []
+    section: Optional[List[str]] = None
+    for line in text.split('\n'):
+        if line.startswith('== '):
+            name, doors, items, section = line.strip('= '), [], [], None
+        elif line == 'Doors here lead:':
+            section = doors
+        elif line == 'Items here:':
+            section = items
+        elif line.startswith('- ') and section is not None:
+            section.append(line[2:])
+        else:
+            section = None
+    return name, doors, items
+
+
+class Explorer:
+
+    opposite = {'north': 'south', 'south': 'north', 'east': 'west', 'west': 'east'}
+
+    def __init__(self, program: Sequence[int]) -> None:
+        '''
+        Walk the ship depth first, mapping rooms and doors and
+        taking every item which is not a trap, then go to the
+        security checkpoint. Every item is first taken by a copy
+        of the droid, which is thrown away if the program ends,
+        loops or the droid can not move any more.
+        '''
+        self.droid = Droid(program)
+        self.rooms: Dict[str, Dict[str, Optional[str]]] = {}
+        self.items: List[str] = []
+        self.traps: Set[str] = set()
+        self.checkpoint = ''
+        self.floor_door = ''  # door of the checkpoint to the pressure-sensitive floor
+
+    def explore(self) -> Droid:
+        start = self.visit(self.droid.output)
+        self.walk(start, self.checkpoint)
+        return self.droid
+
+    def visit(self, text: str) -> str:
+        name, doors, items = parse_room(text)
+        self.rooms.setdefault(name, dict.fromkeys(doors))
+        for item in items:
+            self.take(item, doors)
+        for door in doors:
+            if self.rooms[name][door] is not None:
+                continue
+            text = self.droid.command(door)
+            next_room = parse_room(text)[0]
+            self.rooms[name][door] = next_room
+            if next_room == name:  # pushed back by the pressure-sensitive floor
+                self.checkpoint, self.floor_door = name, door
+                continue
+            if next_room not in self.rooms:
+                self.rooms[next_room] = dict.fromkeys(parse_room(text)[1])
+                self.rooms[next_room][Explorer.opposite[door]] = name
+                self.visit(text)
+            self.rooms[next_room][Explorer.opposite[door]] = name
+            self.droid.command(Explorer.opposite[door])
+        return name
+
+    def take(self, item: str, doors: List[str]) -> None:
+        if item in self.traps:
+            return
+        droid = copy(self.droid)
+        try:
+            droid.command(f'take {item}')
+            probe = copy(droid)
+            probe.command(doors[0])
+            if droid.halted or probe.halted or not parse_room(probe.output)[0]:
+                raise Runaway
+        except Runaway:
+            self.traps.add(item)
+            return
+        self.droid = droid
+        self.items.append(item)
+
+    def walk(self, start: str, end: str) -> None:
+        '''
+        Go from start to end along the shortest way.
+        '''
+        parents: Dict[str, Tuple[str, str]] = {start: (start, '')}
+        queue = deque([start])
+        while queue and end not in parents:
+            room = queue.popleft()
+            for door, next_room in self.rooms[room].items():
+                if next_room and next_room not in parents:
+                    parents[next_room] = (room, door)
+                    queue.append(next_room)
+        doors = []
+        while end != start:
+            end, door = parents[end]
+            doors.append(door)
+        for door in reversed(doors):
+            self.droid.command(door)
+
+
+def pass_floor(droid: Droid, items: Sequence[str], door: str) -> str:
+    '''
+    From the security checkpoint, carrying items, try to go
+    through door with every group of items in Gray code order
+    (starting from all of them), so that consecutive groups differ
+    by one item. If the droid was too light every group contained
+    in the one tried is skipped, if too heavy every group containing
+    it; after a skip the droid takes and drops every item by which
+    the next group tried differs from the one it carries.
+    Return what the program says when one is let through.
+    '''
+    everything = (1 << len(items)) - 1
+    carried = everything
+    too_light: List[int] = []
+    too_heavy: List[int] = []
+    for i in range(1 << len(items)):
+        group = i ^ (i >> 1) ^ everything
+        if any(group & light == group for light in too_light):
+            continue
+        if any(group & heavy == heavy for heavy in too_heavy):
+            continue
+        for bit, item in enumerate(items):
+            if (group ^ carried) >> bit & 1:
+                droid.command(f'take {item}' if group >> bit & 1 else f'drop {item}')
+        carried = group
+        text = droid.command(door)
+        if droid.halted:
+            return text
+        if 'heavier than the detected value' in text:
+            too_light.append(group)
+        elif 'lighter than the detected value' in text:
+            too_heavy.append(group)
+    return ''
+
+
 class IntcodeComputer:
 
     def __init__(self) -> None:
@@ -289,36 +525,13 @@ class IntcodeComputer:
 def run():
     with open('input.txt', encoding='utf-8') as fh:
         program = [int(code) for code in fh.read().split(',')]
-    computer = IntcodeComputer()
-    commands = [
-        ord(c) for c in
-        'south\ntake cake\n'
-        'south\nwest\ntake mutex\n'
-        'east\nnorth\nnorth\nwest\ntake klein bottle\n'
-        'south\neast\ntake monolith\n'
-        'south\ntake fuel cell\n'
-        'west\nwest\ntake astrolabe\n'
-        'east\neast\nnorth\nwest\nnorth\nwest\nnorth\ntake tambourine\n'
-        'south\nwest\ntake dark matter\n'
-        'west\n'
-    ]
-    collectables = [
-        'cake', 'klein bottle', 'monolith', 'mutex', 'astrolabe',
-        'fuel cell', 'dark matter', 'tambourine'
-    ]
-    commands.extend(ord(c) for item in collectables for c in 'drop ' + item + '\n')
-
-    items_combinations = set()
-    for n in range(1, len(collectables) + 1):
-        items_combinations.update(combinations(collectables, n))
-    for group in items_combinations:
-        for item in group:
-            commands.extend(ord(c) for c in 'take ' + item + '\n')
-        commands.extend(ord(c) for c in 'north\n')
-        for item in group:
-            commands.extend(ord(c) for c in 'drop ' + item + '\n')
-
-    computer.run_program(Program(program, 0, commands, 0, AsciiPrinter(), Console()))
+
+    #IntcodeComputer().run_program(Program(program, 0, [], 0, AsciiChannel(), Console()))  # play by hand
+    explorer = Explorer(program)
+    droid = explorer.explore()
+    print(f'Items taken: {", ".join(explorer.items)}')
+    print(f'Traps left: {", ".join(sorted(explorer.traps))}')
+    print(pass_floor(droid, explorer.items, explorer.floor_door))
 
 
 if __name__ == '__main__':
@@ -2,61 +2,166 @@
 # -*- coding: utf-8 -*-
 
 
-from typing import Any, Sequence, Mapping, Set, List
+from typing import Sequence, List, Tuple, Iterator, NamedTuple, Dict, Iterable
+from bisect import bisect_left, insort
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+
+
+class Segment(NamedTuple):
+    fixed: int  # y of horizontal segments, x of vertical ones
+    start: int  # the other coordinate, where the wire enters the segment
+    end: int  # and where it leaves it
+    steps: int  # steps of the wire up to start
+
+    def steps_to(self, coord: int) -> int:
+        return self.steps + abs(coord - self.start)
+
+    def bounds(self) -> Tuple[int, int]:
+        return min(self.start, self.end), max(self.start, self.end)
 
 
 class Wire:
 
-    def __init__(self, path: Sequence[str]) -> None:
+    def __init__(self, path: Sequence[Tuple[str, int]]) -> None:
         self.path = path
         self.length = 0
-        self.coordinates = self.compute_path()
+        self.horizontal: List[Segment] = []
+        self.vertical: List[Segment] = []
+        self.compute_segments()
 
-    def compute_path(self) -> Mapping[tuple, int]:
-        coords = {}
-        pos = [0, 0]
+    def compute_segments(self) -> None:
+        x = y = 0
         for direction, length in self.path:
-            for step in range(length):
-                if direction == 'U':
-                    pos[0] += 1
-                elif direction == 'D':
-                    pos[0] -= 1
-                elif direction == 'R':
-                    pos[1] += 1
-                elif direction == 'L':
-                    pos[1] -= 1
-                self.length += 1
-                try:
-                    coords[tuple(pos)]
-                except KeyError:
-                    coords[tuple(pos)] = self.length
-        return coords
-
-    def compare_paths(self, other: Set[tuple]) -> List:
-        intersections = []
-        for pos in self.coordinates:
-            if pos in other.keys():
-                intersections.append(
-                    (pos, self.coordinates[pos] + other[pos])
+            if direction in 'RL':
+                end = x + length if direction == 'R' else x - length
+                self.horizontal.append(Segment(y, x, end, self.length))
+                x = end
+            else:
+                end = y + length if direction == 'U' else y - length
+                self.vertical.append(Segment(x, y, end, self.length))
+                y = end
+            self.length += length
+
+
+Crossing = Tuple[int, int, Tuple[int, int], int]  # wires, position, steps of both wires
+
+def crossings(wires: Sequence[Wire]) -> Iterator[Crossing]:
+    '''
+    Yield the points where any two wires (by index, the lower
+    first) cross with the steps needed by both to get there
+    (not necessarily the fewest for a point, as a wire may pass
+    over it more than once), without ever walking the wires
+    a step at a time. Where segments of two wires overlap,
+    only the points of the overlap nearest to the origin
+    and the ends of the overlap (where the steps are fewest)
+    are yielded.
+    '''
+    yield from perpendicular_crossings(wires)
+    for first, second, pos, steps in overlaps([wire.horizontal for wire in wires]):
+        yield first, second, pos, steps
+    for first, second, pos, steps in overlaps([wire.vertical for wire in wires]):
+        yield first, second, pos[::-1], steps
+
+def perpendicular_crossings(wires: Sequence[Wire]) -> Iterator[Crossing]:
+    '''
+    Sweep a vertical line from left to right, keeping the
+    horizontal segments of all the wires under the line in
+    a single list sorted by y, and look up the ones crossed
+    by every vertical segment.
+    '''
+    events = []  # x, kind (0: horizontal begins, 1: vertical, 2: horizontal ends), wire, segment
+    for wire, segments in enumerate(wires):
+        for segment in segments.horizontal:
+            left, right = segment.bounds()
+            events.append((left, 0, wire, segment))
+            events.append((right, 2, wire, segment))
+        for segment in segments.vertical:
+            events.append((segment.fixed, 1, wire, segment))
+    events.sort(key=lambda event: event[:3])
+    active: List[Tuple[int, int, int, Segment]] = []
+    for x, kind, wire, segment in events:
+        key = (segment.fixed, id(segment), wire, segment)
+        if kind == 0:
+            insort(active, key)
+        elif kind == 2:
+            del active[bisect_left(active, key)]
+        else:
+            bottom, top = segment.bounds()
+            for index in range(bisect_left(active, (bottom,)), len(active)):
+                y, _, other_wire, other = active[index]
+                if y > top:
+                    break
+                if other_wire != wire and (x or y):
+                    yield (
+                        min(wire, other_wire), max(wire, other_wire),
+                        (x, y), segment.steps_to(y) + other.steps_to(x)
+                    )
+
+def overlaps(segments: Sequence[List[Segment]]) -> Iterator[Crossing]:
+    '''
+    Crossings of parallel segments of different wires lying
+    on the same line, as if the segments were horizontal.
+    '''
+    lines: Dict[int, List[Tuple[int, Segment]]] = {}
+    for wire, wire_segments in enumerate(segments):
+        for segment in wire_segments:
+            lines.setdefault(segment.fixed, []).append((wire, segment))
+    for fixed, line in lines.items():
+        for (first, segment), (second, other) in combinations(line, 2):
+            if first == second:
+                continue
+            low = max(segment.bounds()[0], other.bounds()[0])
+            high = min(segment.bounds()[1], other.bounds()[1])
+            if low > high:
+                continue
+            coords = {low, high, min(max(0, low), high)}
+            if not fixed and 0 in coords:  # the origin does not count, take its neighbours
+                coords.discard(0)
+                coords.update(coord for coord in (max(low, 1), min(high, -1)) if low <= coord <= high)
+            for coord in coords:
+                yield (
+                    min(first, second), max(first, second),
+                    (coord, fixed), segment.steps_to(coord) + other.steps_to(coord)
                 )
-        return intersections
+
+def closest_crossings(wires: Sequence[Wire]) -> Dict[Tuple[int, int], Tuple[int, int]]:
+    '''
+    For every pair of wires which cross, the lowest distance from
+    the origin of a crossing and the minimum number of steps.
+    '''
+    closest: Dict[Tuple[int, int], Tuple[int, int]] = {}
+    for first, second, (x, y), steps in crossings(wires):
+        distance = abs(x) + abs(y)
+        if (first, second) in closest:
+            best_distance, best_steps = closest[(first, second)]
+            distance, steps = min(distance, best_distance), min(steps, best_steps)
+        closest[(first, second)] = (distance, steps)
+    return closest
+
+
+def read_wires(lines: Iterable[str], workers: int = 0) -> List[Wire]:
+    '''
+    Build the segments of every wire, in a pool of
+    processes if workers > 0.
+    '''
+    paths = [[(step[0], int(step[1:])) for step in line.split(',') if step.strip()] for line in lines if line.strip()]
+    if not workers:
+        return [Wire(path) for path in paths]
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(Wire, paths))
 
 
 def run():
-    wires = []
     with open('input.txt', encoding='utf-8') as fh:
-        for line in fh:
-            path = [(step[0], int(step[1:])) for step in line.split(',') if step]
-            wires.append(Wire(path))
-    wires[0].compute_path()
-    wires[1].compute_path()
-    intersections = wires[0].compare_paths(wires[1].coordinates)
-
-    min_distance = min(intersections, key=lambda elem: elem[0][0] + elem[0][1])
-    print("Lowest distance:", min_distance[0][0] + min_distance[0][1])
-
-    min_steps = min(intersections, key=lambda elem: elem[1])
-    print("Minimum number of steps:", min_steps[1])
+        wires = read_wires(fh)
+        #wires = read_wires(fh, workers=4)
+
+    for (first, second), (distance, steps) in sorted(closest_crossings(wires).items()):
+        if len(wires) > 2:
+            print(f'Wires {first} and {second}:')
+        print("Lowest distance:", distance)
+        print("Minimum number of steps:", steps)
 
 
 if __name__ == '__main__':
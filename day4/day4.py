@@ -2,43 +2,44 @@
 # -*- coding: utf-8 -*-
 
 
+from typing import Iterator, Tuple, List
+from itertools import combinations_with_replacement, groupby
+
+
+def non_decreasing(low: int, high: int) -> Iterator[Tuple[str, ...]]:
+    '''
+    Digits of the numbers between low and high (included)
+    whose digits never decrease, in increasing order.
+    Only such sequences of digits are generated: none of
+    them can start with a 0, so they are the combinations
+    with repetition of the digits from 1 to 9.
+    '''
+    for length in range(len(str(low)), len(str(high)) + 1):
+        for digits in combinations_with_replacement('123456789', length):
+            num = int(''.join(digits))
+            if num > high:
+                return
+            if num >= low:
+                yield digits
+
+
+def runs(digits: Tuple[str, ...]) -> List[int]:
+    return [len(list(group)) for _, group in groupby(digits)]
+
+
 def run():
     with open('input.txt', encoding='utf-8') as fh:
         psw_range = [int(limit) for limit in fh.read().split('-')]
-    num = psw_range[0]
-    passwords_first_part = set()
-    passwords_second_part = set()
-    for num in range(psw_range[0], psw_range[1]+1):
-        digits = str(num)
-        is_monotonic = True
-        doubles = set()
-        more_than_doubles = set()
-        previous = digits[0]
-        for i, digit in enumerate(digits[1:], 1):
-            if previous == digit:
-                doubles.add(digit)
-                row = 2
-                for d in digits[i-2::-1]:
-                    if d == digit:
-                        row += 1
-                    else:
-                        break
-                for d in digits[i+1:]:
-                    if d == digit:
-                        row += 1
-                    else:
-                        break
-                if row > 2:
-                    more_than_doubles.add(digit)
-            if int(digit) < int(previous):
-                is_monotonic = False
-            previous = digit
-        if doubles and is_monotonic:
-            passwords_first_part.add(num)
-            if (doubles - more_than_doubles) and is_monotonic:
-                passwords_second_part.add(num)
-    print(len(passwords_first_part))
-    print(len(passwords_second_part))
+    passwords_first_part = 0
+    passwords_second_part = 0
+    for digits in non_decreasing(psw_range[0], psw_range[1]):
+        lengths = runs(digits)
+        if max(lengths) >= 2:
+            passwords_first_part += 1
+            if 2 in lengths:
+                passwords_second_part += 1
+    print(passwords_first_part)
+    print(passwords_second_part)
 
 
 if __name__ == '__main__':